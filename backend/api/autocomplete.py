@@ -0,0 +1,79 @@
+from bisect import bisect_left
+
+from django.db import connection
+from django.db.models import Case, IntegerField, Value, When
+
+from .memory_index import MemoryIndex
+from recipes.models import Ingredient
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+TRIGRAM_MIN_LENGTH = 3
+
+FIELDS = ('id', 'name', 'measurement_unit')
+
+
+class IngredientIndex(MemoryIndex):
+    """Отсортированный по названию индекс ингредиентов в памяти процесса.
+
+    Используется, когда база не умеет искать по индексу без учёта
+    регистра в кириллице (SQLite).
+    """
+
+    name = 'ingredients'
+
+    def __init__(self):
+        super().__init__()
+        self._data = ([], [])
+
+    def load(self):
+        entries = sorted(
+            (name.casefold(), pk, name, unit)
+            for pk, name, unit in Ingredient.objects.values_list(*FIELDS)
+        )
+        self._data = ([entry[0] for entry in entries], entries)
+
+    def search(self, query, limit):
+        """Сначала совпадения по началу названия, затем по вхождению."""
+        self._ensure_loaded()
+        keys, entries = self._data
+        query = query.casefold()
+        result = []
+        position = bisect_left(keys, query)
+        while (position < len(keys) and len(result) < limit
+               and keys[position].startswith(query)):
+            result.append(entries[position])
+            position += 1
+        if len(result) < limit:
+            for entry in entries:
+                if query in entry[0] and not entry[0].startswith(query):
+                    result.append(entry)
+                    if len(result) == limit:
+                        break
+        return [dict(zip(FIELDS, entry[1:])) for entry in result]
+
+
+ingredient_index = IngredientIndex()
+
+
+def search_database(query, limit):
+    """Поиск по индексам PostgreSQL: btree для префикса, trigram для
+    вхождения (trigram-индекс работает от трёх символов)."""
+    ranked = Ingredient.objects.annotate(
+        rank=Case(When(name__istartswith=query, then=Value(0)),
+                  default=Value(1), output_field=IntegerField())
+    )
+    if len(query) < TRIGRAM_MIN_LENGTH:
+        ranked = ranked.filter(name__istartswith=query)
+    else:
+        ranked = ranked.filter(name__icontains=query)
+    return list(ranked.order_by('rank', 'name', 'id').values(*FIELDS)[:limit])
+
+
+def autocomplete_ingredients(query, limit=DEFAULT_LIMIT):
+    query = query.strip()
+    if not query:
+        return []
+    if connection.vendor == 'postgresql':
+        return search_database(query, limit)
+    return ingredient_index.search(query, limit)
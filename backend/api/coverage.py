@@ -0,0 +1,107 @@
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict, namedtuple
+
+from .memory_index import MemoryIndex
+from recipes.models import RecipesIngredient
+
+MAX_PANTRY_SIZE = 200
+
+Match = namedtuple('Match', 'recipe_id matched missing coverage')
+
+
+def _postings(recipe_ids):
+    return array('L', sorted(recipe_ids))
+
+
+class RecipeIngredientIndex(MemoryIndex):
+    """Обратный индекс «ингредиент - отсортированные id рецептов».
+
+    Списки рецептов хранятся в array и при изменении заменяются целиком,
+    так что поиск читает их без блокировки.
+    """
+
+    name = 'recipe_ingredients'
+
+    def __init__(self):
+        super().__init__()
+        self._postings = {}
+        self._recipes = {}
+
+    def load(self):
+        recipes = defaultdict(set)
+        postings = defaultdict(set)
+        rows = RecipesIngredient.objects.values_list(
+            'recipe_id', 'ingredient_id'
+        )
+        for recipe_id, ingredient_id in rows.iterator():
+            recipes[recipe_id].add(ingredient_id)
+            postings[ingredient_id].add(recipe_id)
+        self._recipes = {recipe_id: frozenset(ingredients)
+                         for recipe_id, ingredients in recipes.items()}
+        self._postings = {ingredient_id: _postings(recipe_ids)
+                          for ingredient_id, recipe_ids in postings.items()}
+
+    def update(self, recipe_ids):
+        """Перечитывает ингредиенты рецептов из базы.
+
+        Удалённые рецепты и рецепты без ингредиентов пропадают из индекса.
+        Остальные процессы перечитают индекс целиком по новой версии.
+        """
+        previous, version = self.publish()
+        if self._loaded_at is None:
+            return
+        recipe_ids = set(recipe_ids)
+        current = defaultdict(set)
+        for recipe_id, ingredient_id in RecipesIngredient.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('recipe_id', 'ingredient_id'):
+            current[recipe_id].add(ingredient_id)
+        with self._lock:
+            for recipe_id in recipe_ids:
+                old = self._recipes.get(recipe_id, frozenset())
+                new = frozenset(current[recipe_id])
+                for ingredient_id in old - new:
+                    recipes = array('L', self._postings[ingredient_id])
+                    del recipes[bisect_left(recipes, recipe_id)]
+                    self._postings[ingredient_id] = recipes
+                for ingredient_id in new - old:
+                    recipes = array('L', self._postings.get(ingredient_id,
+                                                            ()))
+                    insort(recipes, recipe_id)
+                    self._postings[ingredient_id] = recipes
+                if new:
+                    self._recipes[recipe_id] = new
+                else:
+                    self._recipes.pop(recipe_id, None)
+            # Индекс этого процесса уже свежий, если до изменения он
+            # был на прежней версии.
+            if self._version == previous:
+                self._version = version
+
+    def match(self, ingredients, max_missing=None):
+        """Рецепты, где есть хотя бы один из ingredients.
+
+        Сначала рецепты с наибольшей долей имеющихся ингредиентов, затем
+        с наименьшим числом недостающих, затем новые.
+        """
+        self._ensure_loaded()
+        matched = Counter()
+        for ingredient_id in set(ingredients):
+            matched.update(self._postings.get(ingredient_id, ()))
+        matches = []
+        for recipe_id, count in matched.items():
+            total = len(self._recipes.get(recipe_id, ()))
+            if total < count:
+                continue
+            missing = total - count
+            if max_missing is not None and missing > max_missing:
+                continue
+            matches.append(Match(recipe_id, count, missing, count / total))
+        matches.sort(key=lambda match: (
+            -match.coverage, match.missing, -match.recipe_id
+        ))
+        return matches
+
+
+recipe_ingredient_index = RecipeIngredientIndex()
@@ -0,0 +1,85 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from recipes.models import Follow, Recipe
+
+FEED_CACHE_PREFIX = 'feed'
+
+
+def _feed_key(user_id):
+    return f'{FEED_CACHE_PREFIX}:{user_id}'
+
+
+def _load_feed(author_ids, before=None, limit=None):
+    recipes = Recipe.objects.filter(author_id__in=author_ids)
+    if before is not None:
+        recipes = recipes.filter(id__lt=before)
+    return list(recipes.order_by('-id').values_list('id', flat=True)[:limit])
+
+
+def get_feed_ids(user_id, author_ids):
+    """Последние FEED_CACHE_SIZE id рецептов авторов из подписок.
+
+    Возвращает пару (id по убыванию, полный ли это список).
+    """
+    key = _feed_key(user_id)
+    feed = cache.get(key)
+    if feed is None:
+        size = settings.FEED_CACHE_SIZE
+        ids = _load_feed(author_ids, limit=size + 1) if author_ids else []
+        feed = (ids[:size], len(ids) <= size)
+        cache.set(key, feed, settings.FEED_CACHE_TIMEOUT)
+    return feed
+
+
+def get_feed_page(user_id, author_ids, before=None, limit=10):
+    """Страница ленты: id рецептов меньше before и есть ли продолжение.
+
+    Страница собирается из кэша, а за его пределами - запросом к базе.
+    """
+    ids, complete = get_feed_ids(user_id, author_ids)
+    if before is not None:
+        ids = [pk for pk in ids if pk < before]
+    page = ids[:limit + 1]
+    if len(page) <= limit and not complete and author_ids:
+        page += _load_feed(author_ids, page[-1] if page else before,
+                           limit + 1 - len(page))
+    return page[:limit], len(page) > limit
+
+
+def _update_feeds(author_id, recipe_id, add):
+    follower_ids = Follow.objects.filter(
+        following_id=author_id
+    ).values_list('user_id', flat=True)
+    keys = [_feed_key(user_id) for user_id in follower_ids]
+    feeds = cache.get_many(keys)
+    size = settings.FEED_CACHE_SIZE
+    changed = {}
+    for key, (ids, complete) in feeds.items():
+        ids = [pk for pk in ids if pk != recipe_id]
+        if add and (complete or not ids or recipe_id > ids[-1]):
+            ids.append(recipe_id)
+            ids.sort(reverse=True)
+            if len(ids) > size:
+                ids, complete = ids[:size], False
+        changed[key] = (ids, complete)
+    if changed:
+        cache.set_many(changed, settings.FEED_CACHE_TIMEOUT)
+
+
+def push_to_feeds(author_id, recipe_id):
+    """Добавляет новый рецепт в закэшированные ленты подписчиков.
+
+    Ленты без кэша не трогает: они соберутся при следующем чтении.
+    """
+    transaction.on_commit(lambda: _update_feeds(author_id, recipe_id, True))
+
+
+def remove_from_feeds(author_id, recipe_id):
+    transaction.on_commit(lambda: _update_feeds(author_id, recipe_id, False))
+
+
+def invalidate_feed(user_id):
+    """Сбрасывает ленту после изменения подписок пользователя."""
+    transaction.on_commit(lambda: cache.delete(_feed_key(user_id)))
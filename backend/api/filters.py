@@ -1,13 +1,30 @@
+from django.db.models import Exists, OuterRef
 from django_filters.rest_framework import filters, FilterSet
+from rest_framework.exceptions import ValidationError
 
+from .search import search_recipes
 from recipes.models import Ingredient, Recipe, Tag
 
+TAG_MATCHES = ('any', 'all')
+
+RECIPE_ORDERINGS = {
+    'newest': ('-id',),
+    'popular': ('-favourites_count', '-id'),
+    'trending': ('-trend_score', '-id'),
+    'cooking_time': ('cooking_time', '-id'),
+}
+
 
 class RecipeFilter(FilterSet):
     tags = filters.ModelMultipleChoiceFilter(
         queryset=Tag.objects.all(),
         field_name='tags__slug',
         to_field_name='slug',
+        method='get_tags'
+    )
+    tags_match = filters.ChoiceFilter(
+        choices=[(name, name) for name in TAG_MATCHES],
+        method='get_tags_match'
     )
     is_favorited = filters.BooleanFilter(
         method='get_is_favorited'
@@ -15,10 +32,39 @@ class RecipeFilter(FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         method='get_is_in_shopping_cart'
     )
+    search = filters.CharFilter(method='get_search')
+    ordering = filters.ChoiceFilter(
+        choices=[(name, name) for name in RECIPE_ORDERINGS],
+        method='get_ordering'
+    )
 
     class Meta:
         model = Recipe
-        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart')
+        fields = ('author', 'tags', 'tags_match', 'is_favorited',
+                  'is_in_shopping_cart', 'search', 'ordering')
+
+    def get_tags(self, queryset, name, value):
+        """EXISTS по таблице связей вместо JOIN: рецепты не повторяются.
+
+        tags_match=any (по умолчанию) - хотя бы один из тэгов,
+        tags_match=all - все тэги сразу.
+        """
+        tag_ids = {tag.id for tag in value}
+        if not tag_ids:
+            return queryset
+        recipe_tags = Recipe.tags.through.objects.filter(
+            recipe_id=OuterRef('pk')
+        )
+        if self.form.cleaned_data.get('tags_match') == 'all':
+            for tag_id in sorted(tag_ids):
+                queryset = queryset.filter(
+                    Exists(recipe_tags.filter(tag_id=tag_id))
+                )
+            return queryset
+        return queryset.filter(Exists(recipe_tags.filter(tag_id__in=tag_ids)))
+
+    def get_tags_match(self, queryset, name, value):
+        return queryset
 
     def get_is_favorited(self, queryset, name, value):
         if self.request.user.is_authenticated and value:
@@ -30,6 +76,21 @@ class RecipeFilter(FilterSet):
             return queryset.filter(purchases__user=self.request.user)
         return queryset
 
+    def get_search(self, queryset, name, value):
+        """Полнотекстовый поиск; без ordering - по релевантности."""
+        if not value.strip():
+            return queryset
+        return search_recipes(queryset, value)
+
+    def get_ordering(self, queryset, name, value):
+        params = self.request.query_params
+        if value != 'newest' and (params.get('pagination') == 'cursor'
+                                  or 'cursor' in params):
+            raise ValidationError({'ordering': [
+                'Выдача по курсору поддерживает только ordering=newest.'
+            ]})
+        return queryset.order_by(*RECIPE_ORDERINGS[value])
+
 
 class IngredientFilter(FilterSet):
     name = filters.CharFilter(lookup_expr='istartswith')
@@ -0,0 +1,69 @@
+import statistics
+import time
+
+from django.core.management import BaseCommand
+from django.db import connection
+
+from api.autocomplete import (DEFAULT_LIMIT, autocomplete_ingredients,
+                              ingredient_index, search_database)
+from recipes.models import Ingredient
+
+
+class Command(BaseCommand):
+    help = 'Замеряет автодополнение ингредиентов по всему каталогу.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-length',
+            type=int,
+            default=4,
+            help='Самая длинная проверяемая часть названия.',
+        )
+        parser.add_argument('--limit', type=int, default=DEFAULT_LIMIT)
+
+    def get_queries(self, max_length):
+        """Все начала и середины названий из каталога."""
+        queries = set()
+        for name in Ingredient.objects.values_list('name', flat=True):
+            for length in range(1, max_length + 1):
+                queries.add(name[:length])
+                queries.add(name[length:2 * length])
+        queries.discard('')
+        return sorted(queries)
+
+    def measure(self, label, search, queries, limit):
+        timings = []
+        for query in queries:
+            started = time.perf_counter()
+            search(query, limit)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        self.stdout.write(
+            f'{label}: запросов {len(timings)}, '
+            f'p50 {statistics.median(timings):.3f} мс, '
+            f'p95 {timings[int(len(timings) * 0.95)]:.3f} мс, '
+            f'max {timings[-1]:.3f} мс'
+        )
+
+    def handle(self, *args, **options):
+        queries = self.get_queries(options['max_length'])
+        if not queries:
+            self.stdout.write('Каталог ингредиентов пуст.')
+            return
+        self.stdout.write(
+            f'Ингредиентов: {Ingredient.objects.count()}, '
+            f'база: {connection.vendor}'
+        )
+        ingredient_index.reset()
+        started = time.perf_counter()
+        ingredient_index.search(queries[0], 1)
+        self.stdout.write(f'Загрузка индекса в память: '
+                          f'{(time.perf_counter() - started) * 1000:.1f} мс')
+        limit = options['limit']
+        self.measure('Индекс в памяти', ingredient_index.search,
+                     queries, limit)
+        if connection.vendor == 'postgresql':
+            self.measure('Индексы PostgreSQL', search_database,
+                         queries, limit)
+        self.measure('API (autocomplete_ingredients)',
+                     autocomplete_ingredients, queries, limit)
@@ -0,0 +1,135 @@
+import random
+import statistics
+import time
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count, F, FloatField, Q
+from django.db.models.functions import Cast
+
+from api.coverage import RecipeIngredientIndex
+from recipes.models import Ingredient, Recipe, RecipesIngredient
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает поиск рецептов по имеющимся ингредиентам через '
+            'обратный индекс и через SQL. Синтетические данные создаются '
+            'в транзакции и откатываются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=100000)
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument(
+            '--per-recipe',
+            type=int,
+            default=8,
+            help='Сколько ингредиентов у каждого рецепта.',
+        )
+        parser.add_argument(
+            '--pantry',
+            type=int,
+            default=15,
+            help='Сколько ингредиентов есть у пользователя.',
+        )
+        parser.add_argument('--max-missing', type=int, default=None)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def create_data(self, options):
+        author = User.objects.create(
+            username='bench_ingredient_match',
+            email='bench_ingredient_match@example.com',
+        )
+        Ingredient.objects.bulk_create(
+            (Ingredient(name=f'bench {index}', measurement_unit='г')
+             for index in range(options['ingredients'])),
+            batch_size=5000
+        )
+        ingredient_ids = list(Ingredient.objects.filter(
+            name__startswith='bench '
+        ).values_list('id', flat=True))
+        Recipe.objects.bulk_create(
+            (Recipe(author=author, name=f'bench {index}', image='bench.png',
+                    text='bench', cooking_time=1)
+             for index in range(options['recipes'])),
+            batch_size=5000
+        )
+        recipe_ids = Recipe.objects.filter(
+            author=author
+        ).values_list('id', flat=True)
+        # Популярные ингредиенты встречаются чаще: вес убывает с номером.
+        weights = [1 / (rank + 1) for rank in range(len(ingredient_ids))]
+        per_recipe = min(options['per_recipe'], len(ingredient_ids))
+        rows = []
+        for recipe_id in recipe_ids.iterator():
+            chosen = set()
+            while len(chosen) < per_recipe:
+                chosen.update(random.choices(ingredient_ids, weights,
+                                             k=per_recipe - len(chosen)))
+            rows.extend(RecipesIngredient(recipe_id=recipe_id,
+                                          ingredient_id=ingredient_id,
+                                          amount=1)
+                        for ingredient_id in chosen)
+        RecipesIngredient.objects.bulk_create(rows, batch_size=5000)
+        return ingredient_ids, weights
+
+    def match_sql(self, pantry, max_missing):
+        matches = RecipesIngredient.objects.values('recipe').annotate(
+            total=Count('ingredient', distinct=True),
+            matched=Count('ingredient', distinct=True,
+                          filter=Q(ingredient__in=pantry)),
+        ).filter(matched__gt=0)
+        if max_missing is not None:
+            matches = matches.filter(
+                total__lte=F('matched') + max_missing
+            )
+        return list(matches.annotate(
+            coverage=Cast('matched', FloatField()) / F('total')
+        ).order_by('-coverage', 'total', '-recipe').values_list(
+            'recipe', 'matched'
+        ))
+
+    def measure(self, label, search, samples):
+        timings = []
+        for pantry in samples:
+            started = time.perf_counter()
+            found = search(pantry)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        self.stdout.write(
+            f'{label}: p50 {statistics.median(timings):.1f} мс, '
+            f'max {timings[-1]:.1f} мс, найдено в последнем запросе: '
+            f'{len(found)}'
+        )
+
+    def handle(self, *args, **options):
+        if options['pantry'] > options['ingredients']:
+            raise CommandError('--pantry больше --ingredients')
+        random.seed(options['seed'])
+        max_missing = options['max_missing']
+        with transaction.atomic():
+            started = time.perf_counter()
+            ingredient_ids, weights = self.create_data(options)
+            self.stdout.write(
+                f'Рецептов: {options["recipes"]}, ингредиентов: '
+                f'{options["ingredients"]}, база: {connection.vendor}, '
+                f'данные созданы за {time.perf_counter() - started:.1f} с'
+            )
+            samples = [
+                set(random.choices(ingredient_ids, weights,
+                                   k=options['pantry']))
+                for _ in range(options['repeat'])
+            ]
+            index = RecipeIngredientIndex()
+            started = time.perf_counter()
+            index.match(samples[0], max_missing)
+            self.stdout.write(f'Загрузка индекса: '
+                              f'{(time.perf_counter() - started):.2f} с')
+            self.measure('Обратный индекс',
+                         lambda pantry: index.match(pantry, max_missing),
+                         samples)
+            self.measure('SQL (GROUP BY recipe)',
+                         lambda pantry: self.match_sql(pantry, max_missing),
+                         samples)
+            transaction.set_rollback(True)
@@ -0,0 +1,135 @@
+import random
+import statistics
+import time
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.http import QueryDict
+
+from api.filters import RecipeFilter
+from recipes.models import Recipe, Tag
+from users.models import User
+
+PAGE_SIZE = 6
+
+
+class Command(BaseCommand):
+    help = ('Замеряет фильтр рецептов по нескольким тэгам на синтетических '
+            'данных. Данные создаются в транзакции и откатываются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=100000)
+        parser.add_argument('--tags', type=int, default=20)
+        parser.add_argument(
+            '--tags-per-recipe',
+            type=int,
+            default=3,
+            help='Сколько тэгов у каждого рецепта.',
+        )
+        parser.add_argument(
+            '--selected',
+            type=int,
+            default=3,
+            help='Сколько тэгов выбирать в одном запросе.',
+        )
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument(
+            '--explain',
+            action='store_true',
+            help='Показать план каждого запроса.',
+        )
+
+    def create_data(self, options):
+        author = User.objects.create(username='bench_tag_filter',
+                                     email='bench_tag_filter@example.com')
+        tags = Tag.objects.bulk_create(
+            Tag(name=f'bench {index}', color=f'#{index:06X}',
+                slug=f'bench-{index}')
+            for index in range(options['tags'])
+        )
+        recipes = Recipe.objects.bulk_create(
+            (Recipe(author=author, name=f'bench {index}', image='bench.png',
+                    text='bench', cooking_time=1 + index % 120)
+             for index in range(options['recipes'])),
+            batch_size=5000
+        )
+        if recipes[0].pk is None:
+            recipes = Recipe.objects.filter(author=author).order_by()
+        tag_ids = [tag.id for tag in Tag.objects.filter(
+            slug__startswith='bench-'
+        )]
+        per_recipe = min(options['tags_per_recipe'], len(tag_ids))
+        Recipe.tags.through.objects.bulk_create(
+            (Recipe.tags.through(recipe_id=recipe.pk, tag_id=tag_id)
+             for recipe in recipes
+             for tag_id in random.sample(tag_ids, per_recipe)),
+            batch_size=5000
+        )
+        return [tag.slug for tag in tags]
+
+    def measure(self, label, build, samples, repeat):
+        timings = []
+        rows = []
+        for slugs in samples[:repeat]:
+            started = time.perf_counter()
+            queryset = build(slugs)
+            count = queryset.count()
+            page = list(queryset.values_list('id', flat=True)[:PAGE_SIZE])
+            timings.append((time.perf_counter() - started) * 1000)
+            rows.append((count, len(page), len(set(page))))
+        timings.sort()
+        count, page, unique = rows[0]
+        self.stdout.write(
+            f'{label}: p50 {statistics.median(timings):.1f} мс, '
+            f'max {timings[-1]:.1f} мс; первый запрос: count={count}, '
+            f'на странице {page}, из них разных {unique}'
+        )
+        if self.explain:
+            self.stdout.write(build(samples[0]).explain())
+
+    def handle(self, *args, **options):
+        if options['selected'] > options['tags']:
+            raise CommandError('--selected больше --tags')
+        random.seed(options['seed'])
+        self.explain = options['explain']
+        with transaction.atomic():
+            started = time.perf_counter()
+            slugs = self.create_data(options)
+            self.stdout.write(
+                f'Рецептов: {options["recipes"]}, тэгов: {options["tags"]}, '
+                f'база: {connection.vendor}, данные созданы за '
+                f'{time.perf_counter() - started:.1f} с'
+            )
+            samples = [random.sample(slugs, options['selected'])
+                       for _ in range(options['repeat'])]
+
+            def with_filter(match):
+                def build(selected):
+                    data = QueryDict(mutable=True)
+                    data.setlist('tags', selected)
+                    data['tags_match'] = match
+                    return RecipeFilter(
+                        data, queryset=Recipe.objects.all()
+                    ).qs
+                return build
+
+            self.measure(
+                'JOIN tags__slug__in',
+                lambda selected: Recipe.objects.filter(
+                    tags__slug__in=selected
+                ),
+                samples, options['repeat']
+            )
+            self.measure(
+                'JOIN + DISTINCT',
+                lambda selected: Recipe.objects.filter(
+                    tags__slug__in=selected
+                ).distinct(),
+                samples, options['repeat']
+            )
+            self.measure('EXISTS, tags_match=any', with_filter('any'),
+                         samples, options['repeat'])
+            self.measure('EXISTS, tags_match=all', with_filter('all'),
+                         samples, options['repeat'])
+            transaction.set_rollback(True)
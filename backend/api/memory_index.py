@@ -0,0 +1,58 @@
+import threading
+import time
+
+from .reference import (bump_reference_versions, get_reference_versions,
+                        get_variant)
+
+INDEX_TTL = 300
+
+
+class MemoryIndex:
+    """Индекс в памяти процесса, перечитываемый из базы.
+
+    Версия индекса лежит в общем кэше: reset() и publish() меняют её,
+    и каждый процесс перечитывает индекс при следующем обращении. С
+    общим бэкендом кэша (CACHE_BACKEND=redis или file) это все воркеры
+    gunicorn, с locmem - только сам процесс, а остальные перечитают
+    индекс не позже чем через INDEX_TTL секунд.
+    """
+
+    name = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded_at = None
+        self._version = None
+
+    def load(self):
+        """Читает данные из базы и подменяет ими индекс."""
+        raise NotImplementedError
+
+    def get_version(self):
+        return get_reference_versions({f'index:{self.name}': None})[0]
+
+    def publish(self):
+        """Меняет версию индекса, возвращает прежнюю и новую."""
+        previous = self.get_version()
+        version = bump_reference_versions([f'index:{self.name}'])
+        return previous, get_variant(version[0])
+
+    def reset(self):
+        """Сбрасывает индекс во всех процессах."""
+        self.publish()
+        self._loaded_at = None
+
+    def _ensure_loaded(self):
+        version = self.get_version()
+        loaded_at = self._loaded_at
+        if (loaded_at is not None and version == self._version
+                and time.monotonic() - loaded_at < INDEX_TTL):
+            return
+        with self._lock:
+            if self._loaded_at != loaded_at:
+                return
+            self.load()
+            # Версия прочитана до загрузки: если reset() пришёл во время
+            # неё, версии не совпадут и индекс перечитается ещё раз.
+            self._version = version
+            self._loaded_at = time.monotonic()
@@ -1,5 +1,145 @@
-from rest_framework import mixins, viewsets
+from django.conf import settings
+from django.db.models import Count
+from django.utils.cache import (get_conditional_response,
+                                patch_cache_control, patch_vary_headers)
+from django.utils.http import http_date, quote_etag
+from rest_framework import mixins, status, viewsets
+from rest_framework.response import Response
+
+from .reference import (get_cached_reference, get_reference_key,
+                        get_reference_versions, get_variant,
+                        set_cached_reference)
 
 
 class ListViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
     pass
+
+
+class ResponseCacheMixin:
+    """Кэширует list и retrieve до смены версий данных ответа.
+
+    Ключ - версии, параметры запроса без учёта порядка и, если в ответе
+    есть флаги зрителя (cache_per_user), сам зритель. Отдаёт ETag
+    и Last-Modified и отвечает 304 на условные запросы.
+    """
+
+    cache_name = None
+    cache_timeout = None
+    cache_per_user = False
+
+    def get_cache_name(self):
+        return self.cache_name
+
+    def get_cache_versions(self):
+        """Словарь «имя версии - время жизни её ключа»."""
+        return {self.get_cache_name(): None}
+
+    def get_cache_viewer(self):
+        if self.cache_per_user and self.request.user.is_authenticated:
+            return self.request.user.id
+        return None
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(super().list, request,
+                                        *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(super().retrieve, request,
+                                        *args, **kwargs)
+
+    def get_cached_response(self, view, request, *args, **kwargs):
+        version, modified = get_reference_versions(
+            self.get_cache_versions()
+        )
+        variant = get_variant(
+            self.action, self.get_cache_viewer(),
+            request.build_absolute_uri('/'),
+            sorted((name, sorted(values))
+                   for name, values in request.query_params.lists()),
+            sorted(kwargs.items()),
+        )
+        etag = quote_etag(f'{version[:12]}-{variant[:12]}')
+        not_modified = get_conditional_response(
+            request, etag=etag, last_modified=modified
+        )
+        if not_modified is not None:
+            not_modified['ETag'] = etag
+            return self.add_cache_headers(not_modified)
+        key = get_reference_key(self.get_cache_name(), version, variant)
+        cached = get_cached_reference(key)
+        if cached is None:
+            response = view(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            # Заголовки вроде X-Count-Exact пагинации - часть ответа.
+            cached = (response.data, {
+                header: value for header, value in response.items()
+                if header != 'Content-Type'
+            })
+            set_cached_reference(key, cached,
+                                 self.get_cache_timeout(response))
+        data, headers = cached
+        response = Response(data, headers=headers)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(modified)
+        return self.add_cache_headers(response)
+
+    def get_cache_timeout(self, response):
+        timeout = self.cache_timeout
+        if timeout is None:
+            timeout = settings.REFERENCE_CACHE_TIMEOUT
+        # Приблизительное число записей не должно жить дольше своего кэша.
+        if response.get('X-Count-Exact') == 'false':
+            timeout = min(timeout, settings.COUNT_CACHE_TIMEOUT)
+        return timeout
+
+    def add_cache_headers(self, response):
+        if self.cache_per_user:
+            patch_vary_headers(response, ('Authorization', 'Cookie'))
+            if self.request.user.is_authenticated:
+                patch_cache_control(response, private=True)
+        return response
+
+
+class ReferenceCacheMixin(ResponseCacheMixin):
+    """Кэширует list и retrieve справочника до смены его версии."""
+
+    reference_name = None
+
+    def get_reference_name(self):
+        return self.reference_name
+
+    def get_cache_name(self):
+        return self.get_reference_name()
+
+
+class RecipeCountMixin:
+    """По ?expand=recipe_count добавляет в ответ число рецептов.
+
+    Без параметра обратная связь с рецептами не читается вовсе.
+    """
+
+    recipe_count_serializer_class = None
+
+    def expand_recipe_count(self):
+        expand = self.request.query_params.get('expand', '')
+        return 'recipe_count' in expand.split(',')
+
+    def get_reference_name(self):
+        name = super().get_reference_name()
+        if self.expand_recipe_count():
+            return f'{name}:recipe_count'
+        return name
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.expand_recipe_count():
+            queryset = queryset.annotate(
+                recipe_count=Count('recipes', distinct=True)
+            )
+        return queryset
+
+    def get_serializer_class(self):
+        if self.expand_recipe_count():
+            return self.recipe_count_serializer_class
+        return super().get_serializer_class()
@@ -1,5 +1,165 @@
-from rest_framework.pagination import PageNumberPagination
+import hashlib
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import (EmptyPage, Page, PageNotAnInteger,
+                                   Paginator)
+from django.core.exceptions import EmptyResultSet
+from django.db import connections
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+COUNT_CACHE_PREFIX = 'count'
+
+
+def estimate_count(queryset):
+    """Оценка планировщика PostgreSQL для запроса без фильтров."""
+    connection = connections[queryset.db]
+    if (connection.vendor != 'postgresql' or queryset.query.where
+            or queryset.query.distinct):
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples::bigint FROM pg_class '
+            'WHERE oid = %s::regclass',
+            [queryset.model._meta.db_table]
+        )
+        row = cursor.fetchone()
+    if row is None or row[0] < settings.COUNT_ESTIMATE_THRESHOLD:
+        return None
+    return row[0]
+
+
+class LookaheadPage(Page):
+    """Страница, про следующую знающая по лишней выбранной строке."""
+
+    def __init__(self, object_list, number, paginator, has_next):
+        super().__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def has_next(self):
+        return self._has_next
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator, который не считает COUNT(*) на каждый запрос.
+
+    Без фильтров на PostgreSQL берёт оценку планировщика, иначе кэширует
+    точное значение по SQL запроса на COUNT_CACHE_TIMEOUT секунд.
+    Выборки, зависящие от зрителя (его избранное, покупки, подписки),
+    считаются всегда точно, чтобы он сразу видел свои изменения.
+    Приблизительное количество только отдаётся в ответе: номер страницы
+    с ним не сверяется, а страница не обрезается по нему.
+    """
+
+    count_exact = True
+
+    def __init__(self, *args, cache_count=True, **kwargs):
+        self.cache_count = cache_count
+        super().__init__(*args, **kwargs)
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not self.cache_count or not isinstance(queryset, QuerySet):
+            return super().count
+        try:
+            sql, params = queryset.query.sql_with_params()
+        except EmptyResultSet:
+            return 0
+        estimate = estimate_count(queryset)
+        if estimate is not None:
+            self.count_exact = False
+            return estimate
+        signature = hashlib.md5(f'{sql}|{params}'.encode()).hexdigest()
+        key = f'{COUNT_CACHE_PREFIX}:{queryset.db}:{signature}'
+        count = cache.get(key)
+        if count is not None:
+            self.count_exact = False
+            return count
+        count = queryset.count()
+        cache.set(key, count, settings.COUNT_CACHE_TIMEOUT)
+        return count
+
+    def is_estimated(self):
+        # count выставляет count_exact при первом обращении.
+        return self.count is not None and not self.count_exact
+
+    def validate_number(self, number):
+        if not self.is_estimated():
+            return super().validate_number(number)
+        try:
+            if isinstance(number, float) and not number.is_integer():
+                raise ValueError
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger(_('That page number is not an integer'))
+        if number < 1:
+            raise EmptyPage(_('That page number is less than 1'))
+        return number
+
+    def page(self, number):
+        if not self.is_estimated():
+            return super().page(number)
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        # Лишняя строка показывает, есть ли следующая страница.
+        object_list = list(
+            self.object_list[bottom:bottom + self.per_page + 1]
+        )
+        if not object_list and number > 1:
+            raise EmptyPage(_('That page contains no results'))
+        return LookaheadPage(object_list[:self.per_page], number, self,
+                             has_next=len(object_list) > self.per_page)
+
+
+class LimitCursorPagination(CursorPagination):
+    """Keyset-пагинация по -id без подсчёта общего количества."""
+
+    ordering = '-id'
+    page_size_query_param = 'limit'
+    max_page_size = settings.MAX_CURSOR_PAGE_LIMIT
 
 
 class PageLimitPagination(PageNumberPagination):
+    """Постраничная пагинация, по ?pagination=cursor - keyset.
+
+    Готовые списки (не QuerySet) всегда делятся на страницы по номеру.
+    """
+
     page_size_query_param = 'limit'
+    django_paginator_class = CachedCountPaginator
+    cursor_pagination_class = LimitCursorPagination
+    cursor_paginator = None
+
+    def use_cursor(self, request):
+        return (
+            request.query_params.get('pagination') == 'cursor'
+            or self.cursor_pagination_class.cursor_query_param
+            in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if isinstance(queryset, QuerySet) and self.use_cursor(request):
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        depends_on_viewer = getattr(view, 'count_depends_on_viewer', None)
+        self.django_paginator_class = partial(
+            CachedCountPaginator,
+            cache_count=not (depends_on_viewer and depends_on_viewer()),
+        )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        response = super().get_paginated_response(data)
+        response['X-Count-Exact'] = str(
+            getattr(self.page.paginator, 'count_exact', True)
+        ).lower()
+        return response
@@ -0,0 +1,67 @@
+from django.conf import settings
+from django.db import transaction
+
+from .reference import bump_reference_versions
+
+# Любое изменение рецепта: сбрасывает списки рецептов.
+RECIPES_VERSION = 'recipes'
+# Изменение сразу всех рецептов: сбрасывает и страницы рецептов.
+ALL_RECIPES_VERSION = 'recipes:all'
+# Данные, от которых зависит только порядок в списке.
+ORDERING_VERSIONS = {
+    'popular': 'recipes:popular',
+    'trending': 'recipes:trending',
+}
+
+
+def recipe_version(recipe_id):
+    return f'recipe:{recipe_id}'
+
+
+def viewer_version(user_id):
+    return f'recipes:viewer:{user_id}'
+
+
+def get_recipe_versions(recipe_id=None, viewer_id=None, ordering=None):
+    """Версии данных ответа: списка (recipe_id=None) или одного рецепта.
+
+    В рецепте есть тэги и ингредиенты, так что их версии тоже входят,
+    а для зрителя - его избранное, покупки и подписки.
+    """
+    timeout = settings.RECIPE_CACHE_TIMEOUT
+    versions = {'tags': None, 'ingredients': None,
+                ALL_RECIPES_VERSION: timeout}
+    if recipe_id is None:
+        versions[RECIPES_VERSION] = timeout
+        if ordering in ORDERING_VERSIONS:
+            versions[ORDERING_VERSIONS[ordering]] = timeout
+    else:
+        versions[recipe_version(recipe_id)] = timeout
+    if viewer_id is not None:
+        versions[viewer_version(viewer_id)] = timeout
+    return versions
+
+
+def _bump_on_commit(names):
+    names = list(names)
+    transaction.on_commit(lambda: bump_reference_versions(
+        names, settings.RECIPE_CACHE_TIMEOUT
+    ))
+
+
+def invalidate_recipes(recipe_ids=None):
+    """Сбрасывает ответы с рецептами recipe_ids (None - со всеми)."""
+    if recipe_ids is None:
+        _bump_on_commit([RECIPES_VERSION, ALL_RECIPES_VERSION])
+        return
+    _bump_on_commit([RECIPES_VERSION,
+                     *map(recipe_version, set(recipe_ids))])
+
+
+def invalidate_viewer_recipes(user_ids):
+    """Сбрасывает ответы с флагами этих пользователей."""
+    _bump_on_commit(map(viewer_version, set(user_ids)))
+
+
+def invalidate_ordering(ordering):
+    _bump_on_commit([ORDERING_VERSIONS[ordering]])
@@ -0,0 +1,60 @@
+import hashlib
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+REFERENCE_CACHE_PREFIX = 'reference'
+
+
+def _version_key(name):
+    return f'{REFERENCE_CACHE_PREFIX}:{name}:version'
+
+
+def _new_version():
+    return (uuid.uuid4().hex, int(time.time()))
+
+
+def get_reference_versions(timeouts):
+    """Общая версия нескольких справочников и время последней смены.
+
+    timeouts - словарь «имя справочника - время жизни ключа версии».
+    Если ключ версии истёк, появляется новая версия: старые ответы
+    просто перестают находиться.
+    """
+    keys = {_version_key(name): name for name in timeouts}
+    versions = cache.get_many(keys)
+    for key, name in keys.items():
+        if key not in versions:
+            versions[key] = cache.get_or_set(key, _new_version,
+                                             timeouts[name])
+    return (
+        get_variant(*(versions[key][0] for key in keys)),
+        max(modified for _, modified in versions.values()),
+    )
+
+
+def bump_reference_versions(names, timeout=None):
+    version = _new_version()
+    cache.set_many({_version_key(name): version for name in names}, timeout)
+    return version
+
+
+def get_variant(*parts):
+    """Короткий отпечаток параметров запроса."""
+    return hashlib.md5('|'.join(map(str, parts)).encode()).hexdigest()
+
+
+def get_reference_key(name, version, variant):
+    return f'{REFERENCE_CACHE_PREFIX}:{name}:{version}:{variant}'
+
+
+def get_cached_reference(key):
+    return cache.get(key)
+
+
+def set_cached_reference(key, data, timeout=None):
+    if timeout is None:
+        timeout = settings.REFERENCE_CACHE_TIMEOUT
+    cache.set(key, data, timeout)
@@ -0,0 +1,199 @@
+import re
+from collections import defaultdict
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import Case, F, IntegerField, Value, When
+
+from .memory_index import MemoryIndex
+from recipes.models import Recipe, RecipesIngredient
+from recipes.search import SEARCH_CONFIG
+
+# Сколько лучших результатов отдаёт индекс в памяти.
+FALLBACK_MAX_RESULTS = 1000
+# Веса полей как у ts_rank по умолчанию: A - название, B - ингредиенты,
+# C - текст рецепта.
+FIELD_WEIGHTS = (1.0, 0.4, 0.2)
+
+VOWELS = 'аеиоуыэюя'
+STOP_WORDS = frozenset(
+    'а без бы в во вы да для до же за и из или к ко как ли на не ни но о '
+    'об от по под при про с со то у уже'.split()
+)
+
+
+def _by_length(*endings):
+    return tuple(sorted(endings, key=len, reverse=True))
+
+
+# Окончания стеммера Snowball для русского языка. Во вторых элементах
+# пар - окончания, которые снимаются только после «а» или «я».
+PERFECTIVE_GERUND = (
+    _by_length('ив', 'ивши', 'ившись', 'ыв', 'ывши', 'ывшись'),
+    _by_length('в', 'вши', 'вшись'),
+)
+ADJECTIVE = (_by_length(
+    'ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый', 'ой', 'ем',
+    'им', 'ым', 'ом', 'его', 'ого', 'ему', 'ому', 'их', 'ых', 'ую', 'юю',
+    'ая', 'яя', 'ою', 'ею'
+), ())
+PARTICIPLE = (
+    _by_length('ивш', 'ывш', 'ующ'),
+    _by_length('ем', 'нн', 'вш', 'ющ', 'щ'),
+)
+REFLEXIVE = (_by_length('ся', 'сь'), ())
+VERB = (
+    _by_length(
+        'ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей',
+        'уй', 'ил', 'ыл', 'им', 'ым', 'ен', 'ило', 'ыло', 'ено', 'ят',
+        'ует', 'уют', 'ит', 'ыт', 'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю'
+    ),
+    _by_length(
+        'ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но',
+        'ет', 'ют', 'ны', 'ть', 'ешь', 'нно'
+    ),
+)
+NOUN = (_by_length(
+    'а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи', 'ии',
+    'и', 'ией', 'ей', 'ой', 'ий', 'й', 'иям', 'ям', 'ием', 'ем', 'ам',
+    'ом', 'о', 'у', 'ах', 'иях', 'ях', 'ы', 'ь', 'ию', 'ью', 'ю', 'ия',
+    'ья', 'я'
+), ())
+SUPERLATIVE = _by_length('ейш', 'ейше')
+DERIVATIONAL = _by_length('ост', 'ость')
+
+
+def _region_after_vowel(word, start):
+    """Начало области после первой пары «гласная, согласная» от start."""
+    for position in range(start + 1, len(word)):
+        if word[position] not in VOWELS and word[position - 1] in VOWELS:
+            return position + 1
+    return len(word)
+
+
+def _strip(word, rv, groups):
+    """Снимает самое длинное окончание из groups, лежащее в RV."""
+    plain, after_a = groups
+    found = None
+    for ending in plain:
+        if word.endswith(ending) and len(word) - len(ending) >= rv:
+            found = (ending, False)
+            break
+    for ending in after_a:
+        if found and len(ending) <= len(found[0]):
+            break
+        if word.endswith(ending) and len(word) - len(ending) >= rv:
+            found = (ending, True)
+            break
+    if found is None:
+        return None
+    ending, needs_a = found
+    start = len(word) - len(ending)
+    if needs_a and (start - 1 < rv or word[start - 1] not in 'ая'):
+        return None
+    return word[:start]
+
+
+def stem(word):
+    """Основа слова по алгоритму Snowball для русского языка."""
+    word = word.replace('ё', 'е')
+    rv = next((position + 1 for position, letter in enumerate(word)
+               if letter in VOWELS), len(word))
+    r2 = _region_after_vowel(word, _region_after_vowel(word, 0) - 1)
+    stripped = _strip(word, rv, PERFECTIVE_GERUND)
+    if stripped is None:
+        word = _strip(word, rv, REFLEXIVE) or word
+        stripped = _strip(word, rv, ADJECTIVE)
+        if stripped is not None:
+            stripped = _strip(stripped, rv, PARTICIPLE) or stripped
+        else:
+            stripped = (_strip(word, rv, VERB)
+                        or _strip(word, rv, NOUN))
+    word = stripped if stripped is not None else word
+    if word.endswith('и') and len(word) - 1 >= rv:
+        word = word[:-1]
+    for ending in DERIVATIONAL:
+        if word.endswith(ending) and len(word) - len(ending) >= r2:
+            word = word[:-len(ending)]
+            break
+    if word.endswith('нн'):
+        return word[:-1]
+    for ending in SUPERLATIVE:
+        if word.endswith(ending) and len(word) - len(ending) >= rv:
+            word = word[:-len(ending)]
+            return word[:-1] if word.endswith('нн') else word
+    if word.endswith('ь') and len(word) - 1 >= rv:
+        return word[:-1]
+    return word
+
+
+def terms(text):
+    return [stem(word) for word in re.findall(r'\w+', text.casefold())
+            if word not in STOP_WORDS]
+
+
+class RecipeSearchIndex(MemoryIndex):
+    """Инвертированный индекс рецептов в памяти процесса.
+
+    Замена search_vector для баз без полнотекстового поиска (SQLite):
+    все слова запроса должны найтись, выше - рецепты с совпадениями
+    в названии, затем в ингредиентах, затем в тексте.
+    """
+
+    name = 'recipe_search'
+
+    def __init__(self):
+        super().__init__()
+        self._postings = {}
+
+    def load(self):
+        ingredients = defaultdict(list)
+        for recipe_id, name in RecipesIngredient.objects.values_list(
+            'recipe_id', 'ingredient__name'
+        ).iterator():
+            ingredients[recipe_id].append(name)
+        postings = defaultdict(lambda: defaultdict(float))
+        for recipe_id, name, text in Recipe.objects.values_list(
+            'id', 'name', 'text'
+        ).iterator():
+            fields = (name, ' '.join(ingredients[recipe_id]), text)
+            for weight, field in zip(FIELD_WEIGHTS, fields):
+                for term in terms(field):
+                    postings[term][recipe_id] += weight
+        self._postings = {term: dict(scores)
+                          for term, scores in postings.items()}
+
+    def search(self, query):
+        """id рецептов, содержащих все слова запроса, по убыванию веса."""
+        self._ensure_loaded()
+        query_terms = set(terms(query))
+        if not query_terms:
+            return []
+        postings = sorted((self._postings.get(term, {})
+                           for term in query_terms), key=len)
+        scores = dict(postings[0])
+        for other in postings[1:]:
+            scores = {recipe_id: score + other[recipe_id]
+                      for recipe_id, score in scores.items()
+                      if recipe_id in other}
+        ranked = sorted(scores, key=lambda pk: (-scores[pk], -pk))
+        return ranked[:FALLBACK_MAX_RESULTS]
+
+
+recipe_search_index = RecipeSearchIndex()
+
+
+def search_recipes(queryset, query):
+    """Оставляет найденные рецепты и сортирует их по релевантности."""
+    if connection.vendor == 'postgresql':
+        search_query = SearchQuery(query, config=SEARCH_CONFIG,
+                                   search_type='websearch')
+        return queryset.filter(search_vector=search_query).annotate(
+            search_rank=SearchRank(F('search_vector'), search_query)
+        ).order_by('-search_rank', '-id')
+    ranked = recipe_search_index.search(query)
+    return queryset.filter(pk__in=ranked).order_by(Case(
+        *(When(pk=pk, then=Value(position))
+          for position, pk in enumerate(ranked)),
+        output_field=IntegerField(),
+    ))
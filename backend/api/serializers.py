@@ -1,14 +1,26 @@
-import base64
+from collections import Counter
 
-from django.core.files.base import ContentFile
-from django.shortcuts import get_object_or_404
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.template.defaultfilters import filesizeformat
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from rest_framework import serializers
+from rest_framework.settings import api_settings
 from rest_framework.validators import UniqueTogetherValidator
 
-from recipes.models import (Favourite, Follow, Ingredient, Purchase, Recipe,
+from recipes.models import (CartIngredient, Ingredient, Recipe,
                             RecipesIngredient, Tag)
+from recipes.images import (decode_base64_image, variant_urls,
+                            versioned_url)
+from recipes.search import update_search_index
 from users.models import User
+from .autocomplete import DEFAULT_LIMIT, MAX_LIMIT
+from .coverage import MAX_PANTRY_SIZE
+from .toggles import BULK_MAX_IDS
+from .viewer import get_viewer_context
+
+MAX_RECIPES_LIMIT = 100
 
 
 class CustomUserSerializer(UserSerializer):
@@ -22,29 +34,59 @@ class CustomUserSerializer(UserSerializer):
                   'is_subscribed')
 
     def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        return (request and request.user.is_authenticated
-                and Follow.objects.filter(
-                    user=request.user, following=obj
-                ).exists())
+        viewer = get_viewer_context(self.context.get('request'))
+        return obj.id in viewer.following_ids
 
 
 class Base64ImageField(serializers.ImageField):
 
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            try:
+                data = decode_base64_image(data)
+            except DjangoValidationError as error:
+                raise serializers.ValidationError(error.messages)
+            # Картинка уже проверена Pillow при декодировании.
+            return serializers.FileField.to_internal_value(self, data)
+        limit = settings.MAX_IMAGE_UPLOAD_SIZE
+        if getattr(data, 'size', 0) > limit:
+            raise serializers.ValidationError(
+                f'Изображение больше {filesizeformat(limit)}.'
+            )
         return super().to_internal_value(data)
 
+    def to_representation(self, value):
+        if not value:
+            return None
+        if not getattr(self, 'use_url', api_settings.UPLOADED_FILES_USE_URL):
+            return value.name
+        url = versioned_url(value.storage, value.name)
+        request = self.context.get('request')
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+
+class ImageVariantsMixin(serializers.Serializer):
+    """URL уменьшенных копий картинки рецепта."""
+
+    image_variants = serializers.SerializerMethodField()
+
+    def get_image_variants(self, obj):
+        request = self.context.get('request')
+        return {
+            variant: request.build_absolute_uri(url) if request and url
+            else url
+            for variant, url in variant_urls(obj).items()
+        }
+
 
 class TagSerializer(serializers.ModelSerializer):
     """Сериалайзер для модели Тэга."""
 
     class Meta:
         model = Tag
-        fields = ('name', 'color', 'slug', 'id', 'recipes')
+        fields = ('name', 'color', 'slug', 'id')
 
     def validate_color(self, data):
         color = data.get('color')
@@ -59,12 +101,78 @@ class TagSerializer(serializers.ModelSerializer):
         return data
 
 
+class TagRecipeCountSerializer(TagSerializer):
+    """Тэг с числом рецептов для ?expand=recipe_count."""
+
+    recipe_count = serializers.IntegerField(read_only=True)
+
+    class Meta(TagSerializer.Meta):
+        fields = TagSerializer.Meta.fields + ('recipe_count',)
+
+
 class IngredientSerializer(serializers.ModelSerializer):
     """Сериалайзер для модели Ингредиента."""
 
     class Meta:
         model = Ingredient
-        fields = ('name', 'measurement_unit', 'id', 'recipes')
+        fields = ('name', 'measurement_unit', 'id')
+
+
+class IngredientRecipeCountSerializer(IngredientSerializer):
+    """Ингредиент с числом рецептов для ?expand=recipe_count."""
+
+    recipe_count = serializers.IntegerField(read_only=True)
+
+    class Meta(IngredientSerializer.Meta):
+        fields = IngredientSerializer.Meta.fields + ('recipe_count',)
+
+
+class AutocompleteQuerySerializer(serializers.Serializer):
+    """Параметры автодополнения ингредиентов."""
+
+    name = serializers.CharField(max_length=200, trim_whitespace=True)
+    limit = serializers.IntegerField(min_value=1, max_value=MAX_LIMIT,
+                                     default=DEFAULT_LIMIT)
+
+
+class BulkIdsSerializer(serializers.Serializer):
+    """Список id для пакетных операций с избранным, покупками и
+    подписками."""
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=BULK_MAX_IDS,
+    )
+
+
+class CoverageQuerySerializer(serializers.Serializer):
+    """Параметры поиска рецептов по имеющимся ингредиентам."""
+
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_PANTRY_SIZE,
+    )
+    max_missing = serializers.IntegerField(min_value=0, required=False)
+
+
+class FeedQuerySerializer(serializers.Serializer):
+    """Параметры ленты: keyset по id рецепта."""
+
+    before = serializers.IntegerField(min_value=1, required=False)
+    limit = serializers.IntegerField(
+        min_value=1, max_value=settings.MAX_CURSOR_PAGE_LIMIT,
+        default=settings.REST_FRAMEWORK['PAGE_SIZE'],
+    )
+
+
+class SubscriptionsQuerySerializer(serializers.Serializer):
+    """Сколько рецептов показывать у каждого автора в подписках."""
+
+    recipes_limit = serializers.IntegerField(
+        min_value=1, max_value=MAX_RECIPES_LIMIT, required=False
+    )
 
 
 class IngredientListSerializer(serializers.ModelSerializer):
@@ -93,7 +201,7 @@ class IngredientPostSerializer(serializers.ModelSerializer):
         fields = ('id', 'amount')
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeSerializer(ImageVariantsMixin, serializers.ModelSerializer):
     """Сериалайзер для модели Рецепта."""
 
     author = CustomUserSerializer(read_only=True)
@@ -106,36 +214,40 @@ class RecipeSerializer(serializers.ModelSerializer):
     class Meta:
         model = Recipe
         fields = ('name', 'author', 'text', 'tags', 'cooking_time', 'image',
-                  'ingredients', 'is_favorited', 'is_in_shopping_cart', 'id')
+                  'image_variants', 'ingredients', 'is_favorited',
+                  'is_in_shopping_cart', 'id')
 
     def get_ingredients(self, obj):
-        ingredients = RecipesIngredient.objects.filter(recipe=obj)
+        ingredients = obj.recipe_ingredients.all()
         return IngredientListSerializer(ingredients, many=True,
                                         read_only=True).data
 
     def get_is_favorited(self, obj):
-        request = self.context.get('request')
-        return (request and request.user.is_authenticated
-                and Favourite.objects.filter(
-                    user=request.user, recipe=obj
-                ).exists())
+        viewer = get_viewer_context(self.context.get('request'))
+        return obj.id in viewer.favourite_ids
 
     def get_is_in_shopping_cart(self, obj):
-        request = self.context.get('request')
-        return (request and request.user.is_authenticated
-                and Purchase.objects.filter(
-                    user=request.user, recipe=obj
-                ).exists())
+        viewer = get_viewer_context(self.context.get('request'))
+        return obj.id in viewer.purchase_ids
+
+
+class RecipeCoverageSerializer(RecipeSerializer):
+    """Рецепт с долей имеющихся у пользователя ингредиентов."""
+
+    matched = serializers.IntegerField(read_only=True)
+    missing = serializers.IntegerField(read_only=True)
+    coverage = serializers.FloatField(read_only=True)
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + ('matched', 'missing',
+                                                 'coverage')
 
 
 class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
     """Сериалайзер для создания или обновления рецепта."""
 
     image = Base64ImageField(required=False, allow_null=True)
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(),
-        many=True
-    )
+    tags = serializers.ListField(child=serializers.IntegerField())
     ingredients = IngredientPostSerializer(many=True)
     author = CustomUserSerializer(read_only=True)
 
@@ -161,39 +273,56 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
         tags = value
         if not tags:
             raise serializers.ValidationError("Необходим хотя бы один тэг")
-        tags_list = []
-        for tag in tags:
-            if tag in tags_list:
-                raise serializers.ValidationError("Тэги не должны повторяться")
-            tags_list.append(tag)
+        if len(set(tags)) != len(tags):
+            raise serializers.ValidationError("Тэги не должны повторяться")
+        missing = set(tags) - set(
+            Tag.objects.filter(id__in=tags).values_list('id', flat=True)
+        )
+        if missing:
+            raise serializers.ValidationError(
+                f"Тэги не найдены: {', '.join(map(str, sorted(missing)))}"
+            )
         return value
 
     def validate_ingredients(self, value):
         ingredients = value
         if not ingredients:
-            raise serializers.ValidationError("Необходим хотя бы один"
+            raise serializers.ValidationError("Необходим хотя бы один "
                                               "ингредиент")
-        ingredients_list = []
-        for ing in ingredients:
-            ingredient = get_object_or_404(Ingredient, id=ing['id'])
-            if ingredient in ingredients_list:
-                raise serializers.ValidationError("Ингредиенты не должны"
-                                                  "повторяться")
-            if int(ing['amount']) <= 0:
-                raise serializers.ValidationError("Ингредиентов должно быть"
-                                                  "больше одного")
-            ingredients_list.append(ingredient)
+        counts = Counter(ing['id'] for ing in ingredients)
+        errors = []
+        duplicates = sorted(
+            ingredient_id for ingredient_id, count in counts.items()
+            if count > 1
+        )
+        if duplicates:
+            errors.append("Ингредиенты не должны повторяться: "
+                          f"{', '.join(map(str, duplicates))}")
+        missing = set(counts) - set(Ingredient.objects.filter(
+            id__in=counts
+        ).values_list('id', flat=True))
+        if missing:
+            errors.append("Ингредиенты не найдены: "
+                          f"{', '.join(map(str, sorted(missing)))}")
+        if any(ing['amount'] <= 0 for ing in ingredients):
+            errors.append("Количество ингредиента должно быть "
+                          "больше нуля")
+        if errors:
+            raise serializers.ValidationError(errors)
         return value
 
     def add_ingredients_to_recipe(self, ingredients, recipe):
+        if not ingredients:
+            return
         RecipesIngredient.objects.bulk_create(
             [RecipesIngredient(
-                ingredient=Ingredient.objects.get(id=ingredient['id']),
+                ingredient_id=ingredient['id'],
                 recipe=recipe,
                 amount=ingredient['amount']
             ) for ingredient in ingredients]
         )
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
@@ -201,56 +330,65 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
         recipe.tags.set(tags)
         self.add_ingredients_to_recipe(ingredients=ingredients,
                                        recipe=recipe)
+        update_search_index([recipe.id])
         return recipe
 
+    def update_tags(self, recipe, tags):
+        current = set(recipe.tags.values_list('id', flat=True))
+        tags = set(tags)
+        if current - tags:
+            recipe.tags.remove(*(current - tags))
+        if tags - current:
+            recipe.tags.add(*(tags - current))
+
+    def update_ingredients(self, recipe, ingredients):
+        """Меняет только добавленные, удалённые и изменённые строки."""
+        amounts = {ing['id']: ing['amount'] for ing in ingredients}
+        delta = Counter(amounts)
+        existing, to_update, to_delete = set(), [], []
+        for row in recipe.recipe_ingredients.all():
+            delta[row.ingredient_id] -= row.amount
+            if row.ingredient_id not in amounts or (
+                row.ingredient_id in existing
+            ):
+                to_delete.append(row.id)
+            elif row.amount != amounts[row.ingredient_id]:
+                row.amount = amounts[row.ingredient_id]
+                to_update.append(row)
+            existing.add(row.ingredient_id)
+        if to_delete:
+            RecipesIngredient.objects.filter(id__in=to_delete).delete()
+        if to_update:
+            RecipesIngredient.objects.bulk_update(to_update, ['amount'])
+        self.add_ingredients_to_recipe(
+            [ing for ing in ingredients if ing['id'] not in existing],
+            recipe
+        )
+        CartIngredient.objects.apply_recipe_delta(recipe, delta)
+
+    @transaction.atomic
     def update(self, instance, validated_data):
-        ingredients = validated_data.pop('ingredients')
-        tags = validated_data.pop('tags')
-        instance.tags.clear()
-        instance.tags.set(tags)
-        RecipesIngredient.objects.filter(recipe=instance).delete()
-        super().update(instance, validated_data)
-        self.add_ingredients_to_recipe(ingredients, instance)
-        instance.save()
+        ingredients = validated_data.pop('ingredients', None)
+        tags = validated_data.pop('tags', None)
+        if tags is not None:
+            self.update_tags(instance, tags)
+        if ingredients is not None:
+            self.update_ingredients(instance, ingredients)
+        instance = super().update(instance, validated_data)
+        update_search_index([instance.id])
         return instance
 
     def to_representation(self, instance):
         request = self.context.get('request')
+        instance = Recipe.objects.with_related().get(pk=instance.pk)
         return RecipeSerializer(instance,
                                 context={'request': request}).data
 
 
-class FollowSerializer(serializers.ModelSerializer):
-    """Сериалайзер для модели Подписок."""
-
-    class Meta:
-        model = Follow
-        fields = ('user', 'following')
-        validators = [
-            UniqueTogetherValidator(
-                queryset=Follow.objects.all(),
-                fields=('user', 'following')
-            )
-        ]
-
-    def validate_following(self, value):
-        if self.context['request'].user != value:
-            return value
-        raise serializers.ValidationError("Нельзя подписаться на себя")
-
-    def to_representation(self, instance):
-        request = self.context.get('request')
-        return FollowListSerializer(
-            instance.following,
-            context={'request': request}
-        ).data
-
-
 class FollowListSerializer(CustomUserSerializer):
     """Сериалайзер для отображения страницы подписок."""
 
     recipes = serializers.SerializerMethodField(read_only=True)
-    recipes_count = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
         model = User
@@ -260,70 +398,28 @@ class FollowListSerializer(CustomUserSerializer):
                             'is_subscribed', 'recipes', 'recipes_count')
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        recipes_limit = None
-        if request:
-            recipes_limit = request.query_params.get('recipes_limit')
-        recipes = obj.recipes.all()
-        if recipes_limit:
-            recipes = obj.recipes.all()[:int(recipes_limit)]
-        return RecipeFollowSerializer(recipes, many=True,
-                                      context={'request': request}).data
-
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
+        """Рецепты из recipes_by_author в контексте, загруженные сразу
+        для всей страницы (Recipe.objects.latest_by_author)."""
+        recipes_by_author = self.context.get('recipes_by_author')
+        if recipes_by_author is None:
+            recipes_by_author = Recipe.objects.latest_by_author(
+                [obj.id], self.context.get('recipes_limit')
+            )
+        return RecipeFollowSerializer(
+            recipes_by_author.get(obj.id, []), many=True,
+            context={'request': self.context.get('request')}
+        ).data
 
 
-class RecipeFollowSerializer(serializers.ModelSerializer):
+class RecipeFollowSerializer(ImageVariantsMixin,
+                             serializers.ModelSerializer):
     """Сериалайзер для рецепта в подписках, избранном, покупках."""
 
     image = Base64ImageField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
-
-
-class FavouriteSerializer(serializers.ModelSerializer):
-    """Сериалайзер для модели Избранного."""
-
-    class Meta:
-        model = Favourite
-        fields = ('recipe', 'user')
-        validators = [
-            UniqueTogetherValidator(
-                queryset=Favourite.objects.all(),
-                fields=('user', 'recipe')
-            )
-        ]
-
-    def to_representation(self, instance):
-        request = self.context.get('request')
-        return RecipeFollowSerializer(
-            instance.recipe,
-            context={'request': request}
-        ).data
-
-
-class PurchaseSerializer(serializers.ModelSerializer):
-    """Сериалайзер для модели Покупок."""
-
-    class Meta:
-        model = Purchase
-        fields = ('recipe', 'user')
-        validators = [
-            UniqueTogetherValidator(
-                queryset=Purchase.objects.all(),
-                fields=('user', 'recipe')
-            )
-        ]
-
-    def to_representation(self, instance):
-        request = self.context.get('request')
-        return RecipeFollowSerializer(
-            instance.recipe,
-            context={'request': request}
-        ).data
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
 
 
 class CustomUserCreateSerializer(UserCreateSerializer):
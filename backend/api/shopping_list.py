@@ -0,0 +1,88 @@
+import csv
+import io
+
+from django.conf import settings
+from django.db.models import F
+
+from recipes.models import CartIngredient
+
+CHUNK_SIZE = 500
+
+
+def get_shopping_list(user):
+    """Ингредиенты из списка покупок, сгруппированные по id."""
+    return CartIngredient.objects.filter(user=user).values(
+        'ingredient',
+        name=F('ingredient__name'),
+        measurement_unit=F('ingredient__measurement_unit'),
+        total_amount=F('amount'),
+    ).order_by('name', 'measurement_unit', 'ingredient')
+
+
+def write_txt(rows):
+    yield 'Список покупок:\n'
+    for row in rows:
+        yield (f'\n{row["name"]} - {row["total_amount"]} '
+               f'{row["measurement_unit"]}')
+
+
+class Echo:
+    """Буфер, который сразу возвращает записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def write_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('Ингредиент', 'Количество', 'Единица измерения'))
+    for row in rows:
+        yield writer.writerow(
+            (row['name'], row['total_amount'], row['measurement_unit'])
+        )
+
+
+def write_pdf(rows):
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+    from reportlab.pdfgen import canvas
+
+    font = 'ShoppingListFont'
+    if font not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(TTFont(font, settings.PDF_FONT_PATH))
+    width, height = A4
+    margin, line_height = 50, 18
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    pdf.setTitle('Список покупок')
+    pdf.setFont(font, 16)
+    pdf.drawString(margin, height - margin, 'Список покупок:')
+    y = height - margin - 2 * line_height
+    pdf.setFont(font, 12)
+    for row in rows:
+        if y < margin:
+            pdf.showPage()
+            pdf.setFont(font, 12)
+            y = height - margin
+        pdf.drawString(
+            margin, y,
+            f'{row["name"]} - {row["total_amount"]} '
+            f'{row["measurement_unit"]}'
+        )
+        y -= line_height
+    pdf.save()
+    yield buffer.getvalue()
+
+
+WRITERS = {
+    'txt': write_txt,
+    'csv': write_csv,
+    'pdf': write_pdf,
+}
+
+
+def stream_shopping_list(user, file_format):
+    """Выгрузка списка покупок по мере чтения строк из курсора."""
+    rows = get_shopping_list(user).iterator(chunk_size=CHUNK_SIZE)
+    return WRITERS[file_format](rows)
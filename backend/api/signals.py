@@ -0,0 +1,179 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .autocomplete import ingredient_index
+from .coverage import recipe_ingredient_index
+from .feed import invalidate_feed, push_to_feeds, remove_from_feeds
+from .recipe_cache import (invalidate_ordering, invalidate_recipes,
+                           invalidate_viewer_recipes)
+from .reference import bump_reference_versions
+from .search import recipe_search_index
+from .viewer import invalidate_viewer_context
+from recipes.models import (Favourite, Follow, Ingredient, Purchase, Recipe,
+                            RecipesIngredient, Tag)
+from recipes.search import update_search_index
+from recipes.signals import (recipes_updated, reference_data_changed,
+                             relations_changed, search_index_changed)
+from users.models import User
+
+VIEWER_SET_BY_MODEL = {
+    Favourite: 'favourite_ids',
+    Purchase: 'purchase_ids',
+    Follow: 'following_ids',
+}
+
+
+@receiver(post_save, sender=Favourite)
+@receiver(post_save, sender=Purchase)
+@receiver(post_save, sender=Follow)
+def invalidate_viewer_sets(sender, instance, **kwargs):
+    invalidate_viewer_context(instance.user_id, VIEWER_SET_BY_MODEL[sender])
+    invalidate_viewer_recipes([instance.user_id])
+    if sender is Follow:
+        invalidate_feed(instance.user_id)
+    if sender is Favourite:
+        invalidate_ordering('popular')
+
+
+@receiver(relations_changed, sender=Favourite)
+@receiver(relations_changed, sender=Purchase)
+@receiver(relations_changed, sender=Follow)
+def invalidate_viewer_sets_for_pairs(sender, pairs, **kwargs):
+    user_ids = {user_id for user_id, _ in pairs}
+    for user_id in user_ids:
+        invalidate_viewer_context(user_id, VIEWER_SET_BY_MODEL[sender])
+        if sender is Follow:
+            invalidate_feed(user_id)
+    invalidate_viewer_recipes(user_ids)
+    if sender is Favourite:
+        invalidate_ordering('popular')
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(reference_data_changed, sender=Ingredient)
+def reset_ingredient_index(sender, **kwargs):
+    transaction.on_commit(ingredient_index.reset)
+
+
+def bump_on_commit(*names):
+    # Версии меняем после фиксации, чтобы параллельное чтение не
+    # закэшировало старые данные под новой версией.
+    transaction.on_commit(lambda: bump_reference_versions(names))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(reference_data_changed, sender=Tag)
+def bump_tags_version(sender, **kwargs):
+    bump_on_commit('tags', 'tags:recipe_count')
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def bump_tag_recipe_counts_version(sender, **kwargs):
+    bump_on_commit('tags:recipe_count')
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(reference_data_changed, sender=Ingredient)
+def bump_ingredients_version(sender, **kwargs):
+    bump_on_commit('ingredients', 'ingredients:recipe_count')
+
+
+@receiver(post_save, sender=RecipesIngredient)
+@receiver(post_delete, sender=RecipesIngredient)
+def bump_ingredient_recipe_counts_version(sender, **kwargs):
+    bump_on_commit('ingredients:recipe_count')
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(search_index_changed, sender=Recipe)
+def bump_recipe_counts_versions(sender, **kwargs):
+    # Ингредиенты рецепта пишутся bulk_create, а связи с тэгами удаляются
+    # каскадом - без post_save и m2m_changed.
+    bump_on_commit('tags:recipe_count', 'ingredients:recipe_count')
+
+
+@receiver(post_save, sender=Ingredient)
+def update_recipes_search_index(sender, instance, created, **kwargs):
+    if not created:
+        update_search_index(list(instance.recipes.values_list(
+            'id', flat=True
+        )))
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(search_index_changed, sender=Recipe)
+def reset_recipe_search_index(sender, **kwargs):
+    transaction.on_commit(recipe_search_index.reset)
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_recipe_from_ingredient_index(sender, instance, **kwargs):
+    recipe_id = instance.id
+    transaction.on_commit(
+        lambda: recipe_ingredient_index.update([recipe_id])
+    )
+
+
+@receiver(search_index_changed, sender=Recipe)
+def update_recipe_ingredient_index(sender, recipe_ids, **kwargs):
+    if recipe_ids is None:
+        transaction.on_commit(recipe_ingredient_index.reset)
+        return
+    transaction.on_commit(
+        lambda: recipe_ingredient_index.update(recipe_ids)
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def add_recipe_to_feeds(sender, instance, created, **kwargs):
+    if created:
+        push_to_feeds(instance.author_id, instance.id)
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_recipe_from_feeds(sender, instance, **kwargs):
+    remove_from_feeds(instance.author_id, instance.id)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def invalidate_recipe_responses(sender, instance, **kwargs):
+    invalidate_recipes([instance.id])
+
+
+@receiver(post_save, sender=RecipesIngredient)
+@receiver(post_delete, sender=RecipesIngredient)
+def invalidate_recipe_ingredient_responses(sender, instance, **kwargs):
+    invalidate_recipes([instance.recipe_id])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_tag_responses(sender, instance, action, reverse,
+                                    pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    invalidate_recipes(pk_set if reverse else [instance.id])
+
+
+@receiver(search_index_changed, sender=Recipe)
+@receiver(recipes_updated, sender=Recipe)
+def invalidate_updated_recipe_responses(sender, recipe_ids, **kwargs):
+    invalidate_recipes(recipe_ids)
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_recipe_responses(sender, instance, created,
+                                       update_fields=None, **kwargs):
+    # Вход пользователя обновляет только last_login, которого нет в ответе.
+    if created or update_fields == frozenset({'last_login'}):
+        return
+    invalidate_recipes(list(instance.recipes.values_list('id', flat=True)))
+
+
+@receiver(reference_data_changed, sender=Recipe)
+def invalidate_trending_responses(sender, **kwargs):
+    invalidate_ordering('trending')
@@ -0,0 +1,677 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.paginator import EmptyPage
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.response import Response
+from rest_framework.test import APIClient
+
+from foodgram.views import serve_media
+
+from recipes.models import (CartIngredient, Favourite, Follow, Ingredient,
+                            Purchase, Recipe, RecipesIngredient, Tag)
+from .autocomplete import IngredientIndex
+from .coverage import RecipeIngredientIndex
+from .feed import FEED_CACHE_PREFIX
+from .pagination import CachedCountPaginator
+from .views import RecipeViewSet
+from recipes.images import versioned_url
+from users.models import User
+
+
+def create_user(username):
+    return User.objects.create_user(
+        username=username, email=f'{username}@example.com',
+        password='pass12345', first_name=username, last_name=username,
+    )
+
+
+def create_recipes(author, count, tags=(), ingredients=()):
+    recipes = []
+    for number in range(count):
+        recipe = Recipe.objects.create(
+            author=author, name=f'Рецепт {number}', text='Текст',
+            cooking_time=number + 1,
+        )
+        recipe.tags.set(tags)
+        RecipesIngredient.objects.bulk_create(
+            RecipesIngredient(recipe=recipe, ingredient=ingredient,
+                              amount=position + 1)
+            for position, ingredient in enumerate(ingredients)
+        )
+        recipes.append(recipe)
+    return recipes
+
+
+class RecipeListQueriesTest(TestCase):
+    """Число запросов списка рецептов не зависит от размера страницы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.reader = create_user('reader')
+        tags = [Tag.objects.create(name=f'Тэг {number}',
+                                   color=f'#00000{number}',
+                                   slug=f'tag{number}')
+                for number in range(3)]
+        ingredients = [Ingredient.objects.create(name=f'Продукт {number}',
+                                                 measurement_unit='г')
+                       for number in range(5)]
+        recipes = create_recipes(cls.author, 20, tags[:2], ingredients[:3])
+        for recipe in recipes[::3]:
+            Favourite.objects.create(user=cls.reader, recipe=recipe)
+            Purchase.objects.create(user=cls.reader, recipe=recipe)
+        Follow.objects.create(user=cls.reader, following=cls.author)
+
+    def count_queries(self, client, limit):
+        # Без кэша ответов, числа записей и множеств зрителя.
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = client.get('/api/recipes/', {'limit': limit})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), limit)
+        return len(context.captured_queries)
+
+    def assert_queries_flat(self, client):
+        self.count_queries(client, 1)
+        counts = [self.count_queries(client, limit) for limit in (2, 6, 20)]
+        self.assertEqual(len(set(counts)), 1, counts)
+
+    def test_anonymous(self):
+        self.assert_queries_flat(APIClient())
+
+    def test_authenticated(self):
+        client = APIClient()
+        client.force_authenticate(self.reader)
+        self.assert_queries_flat(client)
+
+
+class MediaUrlsTest(TestCase):
+    """Неизменяемые URL картинок и раздача media в DEBUG."""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media_settings = override_settings(MEDIA_ROOT=media_root,
+                                           IMAGE_WORKERS=0)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.storage = Recipe._meta.get_field('image').storage
+        self.hashed = self.storage.save('recipes/image.png',
+                                        ContentFile(b'image'))
+        self.legacy = 'recipes/temp.png'
+        os.makedirs(self.storage.path('recipes'), exist_ok=True)
+        with open(self.storage.path(self.legacy), 'wb') as file:
+            file.write(b'legacy')
+        cache.clear()
+
+    def serve(self, name, query='', **headers):
+        request = RequestFactory().get(f'/media/{name}{query}', **headers)
+        return serve_media(request, name,
+                           document_root=self.storage.location)
+
+    def test_versioned_url(self):
+        self.assertEqual(versioned_url(self.storage, self.hashed),
+                         f'/media/{self.hashed}')
+        self.assertRegex(versioned_url(self.storage, self.legacy),
+                         r'^/media/recipes/temp\.png\?v=\d+$')
+
+    def test_serializer_urls(self):
+        recipe = create_recipes(create_user('author'), 1)[0]
+        Recipe.objects.filter(pk=recipe.pk).update(image=self.hashed)
+        data = APIClient().get(f'/api/recipes/{recipe.pk}/').data
+        self.assertTrue(data['image'].endswith(f'/media/{self.hashed}'))
+        Recipe.objects.filter(pk=recipe.pk).update(image=self.legacy)
+        cache.clear()
+        data = APIClient().get(f'/api/recipes/{recipe.pk}/').data
+        self.assertIn('/media/recipes/temp.png?v=', data['image'])
+        self.assertIn('?v=', data['image_variants']['thumbnail'])
+
+    def test_hashed_file_is_immutable(self):
+        response = self.serve(self.hashed)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('immutable', response['Cache-Control'])
+        not_modified = self.serve(self.hashed,
+                                  HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_legacy_file_is_revalidated(self):
+        response = self.serve(self.legacy)
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        self.assertTrue(response.has_header('ETag'))
+        versioned = self.serve(self.legacy, '?v=1')
+        self.assertIn('immutable', versioned['Cache-Control'])
+
+
+class RecipeResponseCacheTest(TestCase):
+    """Кэш ответов списка и страницы рецепта."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.reader = create_user('reader')
+        cls.tag = Tag.objects.create(name='Тэг', color='#000000', slug='tag')
+        cls.recipes = create_recipes(cls.author, 3, [cls.tag])
+
+    def setUp(self):
+        cache.clear()
+        self.anonymous = APIClient()
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def get(self, client, url, **kwargs):
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(url, **kwargs)
+        self.assertEqual(response.status_code, 200)
+        return response, len(context.captured_queries)
+
+    def test_anonymous_list_cached_by_normalized_params(self):
+        first, _ = self.get(self.anonymous,
+                            '/api/recipes/?tags=tag&limit=2&page=1')
+        second, queries = self.get(self.anonymous,
+                                   '/api/recipes/?page=1&limit=2&tags=tag')
+        self.assertEqual(queries, 0)
+        self.assertEqual(first['ETag'], second['ETag'])
+        self.assertEqual(first.data, second.data)
+        self.assertIn('Authorization', second['Vary'])
+        self.assertEqual(second['X-Count-Exact'], first['X-Count-Exact'])
+
+    def test_conditional_request(self):
+        response, _ = self.get(self.anonymous, '/api/recipes/')
+        with CaptureQueriesContext(connection) as context:
+            not_modified = self.anonymous.get(
+                '/api/recipes/', HTTP_IF_NONE_MATCH=response['ETag']
+            )
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(len(context.captured_queries), 0)
+
+    def test_viewer_flags_cached_per_user(self):
+        recipe = self.recipes[0]
+        url = f'/api/recipes/{recipe.id}/'
+        response, _ = self.get(self.client, url)
+        self.assertFalse(response.data['is_favorited'])
+        self.assertIn('private', response['Cache-Control'])
+        self.get(self.anonymous, url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/recipes/{recipe.id}/favorite/')
+        response, _ = self.get(self.client, url)
+        self.assertTrue(response.data['is_favorited'])
+        response, queries = self.get(self.anonymous, url)
+        self.assertFalse(response.data['is_favorited'])
+        self.assertEqual(queries, 0)
+
+    def test_recipe_write_invalidates_only_its_pages(self):
+        changed, other = self.recipes[0], self.recipes[1]
+        for url in (f'/api/recipes/{changed.id}/',
+                    f'/api/recipes/{other.id}/', '/api/recipes/'):
+            self.get(self.anonymous, url)
+        with self.captureOnCommitCallbacks(execute=True):
+            changed.name = 'Новое название'
+            changed.save()
+        response, _ = self.get(self.anonymous, f'/api/recipes/{changed.id}/')
+        self.assertEqual(response.data['name'], 'Новое название')
+        response, _ = self.get(self.anonymous, '/api/recipes/')
+        self.assertIn('Новое название',
+                      [recipe['name'] for recipe in response.data['results']])
+        _, queries = self.get(self.anonymous, f'/api/recipes/{other.id}/')
+        self.assertEqual(queries, 0)
+
+    def test_tag_rename_invalidates_recipes(self):
+        url = f'/api/recipes/{self.recipes[0].id}/'
+        self.get(self.anonymous, url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tag.name = 'Другой тэг'
+            self.tag.save()
+            _, queries = self.get(self.anonymous, url)
+            self.assertEqual(queries, 0)
+        response, _ = self.get(self.anonymous, url)
+        self.assertEqual(response.data['tags'][0]['name'], 'Другой тэг')
+
+    def test_approximate_count_expires_with_count_cache(self):
+        view = RecipeViewSet()
+        self.assertEqual(
+            view.get_cache_timeout(Response(headers={
+                'X-Count-Exact': 'false'
+            })),
+            min(settings.RECIPE_CACHE_TIMEOUT, settings.COUNT_CACHE_TIMEOUT)
+        )
+        self.assertEqual(view.get_cache_timeout(Response()),
+                         settings.RECIPE_CACHE_TIMEOUT)
+
+
+class RecipeCountCacheTest(TestCase):
+    """?expand=recipe_count после создания и удаления рецепта через API."""
+
+    def setUp(self):
+        cache.clear()
+        self.author = create_user('author')
+        self.tag = Tag.objects.create(name='Тэг', color='#000000', slug='tag')
+        self.ingredient = Ingredient.objects.create(name='Продукт',
+                                                    measurement_unit='г')
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def recipe_counts(self):
+        return [
+            {item['id']: item['recipe_count'] for item in self.client.get(
+                f'/api/{name}/', {'expand': 'recipe_count'}
+            ).data}
+            for name in ('tags', 'ingredients')
+        ]
+
+    def test_counts_follow_recipe_writes(self):
+        self.assertEqual(self.recipe_counts(), [{self.tag.id: 0},
+                                                {self.ingredient.id: 0}])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/recipes/', {
+                'name': 'Рецепт', 'text': 'Текст', 'cooking_time': 5,
+                'tags': [self.tag.id],
+                'ingredients': [{'id': self.ingredient.id, 'amount': 1}],
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.recipe_counts(), [{self.tag.id: 1},
+                                                {self.ingredient.id: 1}])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/recipes/{response.data["id"]}/')
+        self.assertEqual(self.recipe_counts(), [{self.tag.id: 0},
+                                                {self.ingredient.id: 0}])
+
+
+class ReferenceCacheTest(TestCase):
+    """Версии кэша тэгов и ингредиентов меняются после фиксации."""
+
+    def setUp(self):
+        cache.clear()
+        self.tag = Tag.objects.create(name='Тэг', color='#000000', slug='tag')
+        self.ingredient = Ingredient.objects.create(name='Продукт',
+                                                    measurement_unit='г')
+        self.client = APIClient()
+
+    def names(self):
+        return [[item['name'] for item in self.client.get(
+            f'/api/{name}/'
+        ).data] for name in ('tags', 'ingredients')]
+
+    def test_rename_visible_after_commit(self):
+        self.assertEqual(self.names(), [['Тэг'], ['Продукт']])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tag.name = 'Другой тэг'
+            self.tag.save()
+            self.ingredient.name = 'Другой продукт'
+            self.ingredient.save()
+            self.assertEqual(self.names(), [['Тэг'], ['Продукт']])
+        self.assertEqual(self.names(), [['Другой тэг'], ['Другой продукт']])
+
+
+class CachedCountPaginatorTest(TestCase):
+    """Страницы при устаревшем количестве из кэша."""
+
+    def setUp(self):
+        cache.clear()
+        self.author = create_user('author')
+        create_recipes(self.author, 1)
+
+    def paginator(self):
+        return CachedCountPaginator(Recipe.objects.order_by('id'), 2)
+
+    def test_pages_not_limited_by_stale_count(self):
+        self.assertEqual(self.paginator().count, 1)
+        create_recipes(self.author, 4)
+        paginator = self.paginator()
+        self.assertEqual(paginator.count, 1)
+        self.assertFalse(paginator.count_exact)
+        first = paginator.page(1)
+        self.assertEqual(len(first), 2)
+        self.assertTrue(first.has_next())
+        last = paginator.page('3')
+        self.assertEqual(len(last), 1)
+        self.assertFalse(last.has_next())
+        with self.assertRaises(EmptyPage):
+            paginator.page(4)
+
+    def test_list_reports_cached_count(self):
+        client = APIClient()
+        client.get('/api/recipes/?limit=2')
+        create_recipes(self.author, 4)
+        response = client.get('/api/recipes/?limit=2&page=3')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertIsNotNone(response.data['previous'])
+        self.assertIsNone(response.data['next'])
+        self.assertEqual(response['X-Count-Exact'], 'false')
+
+
+class MemoryIndexTest(TestCase):
+    """Индексы в памяти при изменениях в другом процессе."""
+
+    def setUp(self):
+        cache.clear()
+        self.salt = Ingredient.objects.create(name='Соль',
+                                              measurement_unit='г')
+        self.recipe = create_recipes(create_user('author'), 1,
+                                     ingredients=[self.salt])[0]
+
+    def test_reset_during_load_is_not_lost(self):
+        index = IngredientIndex()
+        load = index.load
+
+        def load_and_change():
+            load()
+            Ingredient.objects.create(name='Сахар', measurement_unit='г')
+            index.reset()
+
+        index.load = load_and_change
+        self.assertEqual(index.search('са', 10), [])
+        index.load = load
+        self.assertEqual([item['name'] for item in index.search('са', 10)],
+                         ['Сахар'])
+
+    def test_update_reaches_other_workers(self):
+        writer, reader = RecipeIngredientIndex(), RecipeIngredientIndex()
+        pepper = Ingredient.objects.create(name='Перец',
+                                           measurement_unit='г')
+        for index in (writer, reader):
+            self.assertEqual(index.match([pepper.id]), [])
+        RecipesIngredient.objects.create(recipe=self.recipe,
+                                         ingredient=pepper, amount=1)
+        writer.update([self.recipe.id])
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(len(writer.match([pepper.id])), 1)
+        self.assertEqual(len(context.captured_queries), 0)
+        self.assertEqual(len(reader.match([pepper.id])), 1)
+
+
+class ShoppingCartTest(TestCase):
+    """Список покупок CartIngredient после правок рецептов и корзины."""
+
+    def setUp(self):
+        cache.clear()
+        self.author = create_user('author')
+        self.reader = create_user('reader')
+        self.tag = Tag.objects.create(name='Тэг', color='#000000',
+                                      slug='tag')
+        self.salt, self.sugar, self.pepper = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('Соль', 'Сахар', 'Перец')
+        )
+        self.recipe, self.other = create_recipes(
+            self.author, 2, [self.tag], [self.salt, self.sugar]
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+        for recipe in (self.recipe, self.other):
+            self.client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+
+    def cart(self):
+        return dict(CartIngredient.objects.filter(
+            user=self.reader
+        ).values_list('ingredient__name', 'amount'))
+
+    def assert_matches_rebuild(self):
+        output = StringIO()
+        call_command('rebuild_shopping_carts', '--verify', stdout=output)
+        self.assertIn('Списки покупок совпадают', output.getvalue())
+
+    def test_add_and_remove_recipe(self):
+        self.assertEqual(self.cart(), {'Соль': 2, 'Сахар': 4})
+        self.client.delete(f'/api/recipes/{self.other.id}/shopping_cart/')
+        self.assertEqual(self.cart(), {'Соль': 1, 'Сахар': 2})
+        self.assert_matches_rebuild()
+
+    def test_patch_applies_delta(self):
+        author = APIClient()
+        author.force_authenticate(self.author)
+        response = author.patch(f'/api/recipes/{self.recipe.id}/', {
+            'tags': [self.tag.id],
+            'ingredients': [{'id': self.salt.id, 'amount': 5},
+                            {'id': self.pepper.id, 'amount': 3}],
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.cart(), {'Соль': 6, 'Сахар': 2, 'Перец': 3})
+        self.assert_matches_rebuild()
+
+    def test_recipe_delete(self):
+        self.recipe.delete()
+        self.assertEqual(self.cart(), {'Соль': 1, 'Сахар': 2})
+        self.assert_matches_rebuild()
+
+    def test_clear(self):
+        response = self.client.delete('/api/recipes/shopping_cart/clear/')
+        self.assertEqual(response.data, {'deleted': 2})
+        self.assertEqual(self.cart(), {})
+        self.assert_matches_rebuild()
+
+
+class RecipeUpdateDiffTest(TestCase):
+    """PATCH рецепта меняет только отличающиеся тэги и ингредиенты."""
+
+    def setUp(self):
+        cache.clear()
+        self.author = create_user('author')
+        self.tags = [
+            Tag.objects.create(name=f'Тэг {number}', color=f'#00000{number}',
+                               slug=f'tag{number}')
+            for number in range(3)
+        ]
+        self.ingredients = [
+            Ingredient.objects.create(name=f'Продукт {number}',
+                                      measurement_unit='г')
+            for number in range(10)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def patch(self, recipe, data):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.patch(f'/api/recipes/{recipe.id}/', data,
+                                         format='json')
+        self.assertEqual(response.status_code, 200)
+        return context.captured_queries
+
+    def test_changes_only_differences(self):
+        recipe = create_recipes(self.author, 1, self.tags[:2],
+                                self.ingredients[:3])[0]
+        rows = {row.ingredient_id: row.id
+                for row in recipe.recipe_ingredients.all()}
+        through = recipe.tags.through.objects.get(tag=self.tags[0]).id
+        first, second, _, fourth = self.ingredients[:4]
+        self.patch(recipe, {
+            'tags': [self.tags[0].id, self.tags[2].id],
+            'ingredients': [{'id': first.id, 'amount': 1},
+                            {'id': second.id, 'amount': 7},
+                            {'id': fourth.id, 'amount': 4}],
+        })
+        self.assertEqual(
+            {row.ingredient_id: (row.id, row.amount)
+             for row in recipe.recipe_ingredients.all()},
+            {first.id: (rows[first.id], 1), second.id: (rows[second.id], 7),
+             fourth.id: (recipe.recipe_ingredients.get(
+                 ingredient=fourth).id, 4)}
+        )
+        self.assertEqual(
+            recipe.tags.through.objects.get(tag=self.tags[0]).id, through
+        )
+        self.assertEqual(set(recipe.tags.values_list('id', flat=True)),
+                         {self.tags[0].id, self.tags[2].id})
+
+    def test_title_patch_queries(self):
+        small, large = (
+            create_recipes(self.author, 1, self.tags[:count],
+                           self.ingredients[:count * 3])[0]
+            for count in (1, 3)
+        )
+        queries = self.patch(small, {'name': 'Новое название'})
+        self.assertEqual(len(self.patch(large, {'name': 'Другое'})),
+                         len(queries))
+        for query in queries:
+            sql = query['sql']
+            self.assertFalse(
+                'recipesingredient' in sql and not sql.startswith('SELECT'),
+                sql
+            )
+            self.assertFalse(
+                'recipe_tags' in sql and not sql.startswith('SELECT'), sql
+            )
+
+
+class ToggleTest(TestCase):
+    """Избранное, покупки и подписки: повторы и пакетные запросы."""
+
+    def setUp(self):
+        cache.clear()
+        self.author = create_user('author')
+        self.reader = create_user('reader')
+        self.recipes = create_recipes(self.author, 2)
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def assert_toggle(self, url):
+        self.assertEqual(self.client.post(url).status_code, 201)
+        self.assertEqual(self.client.post(url).status_code, 400)
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.client.delete(url).status_code, 400)
+
+    def test_single_toggles(self):
+        recipe = self.recipes[0]
+        for name in ('favorite', 'shopping_cart'):
+            self.assert_toggle(f'/api/recipes/{recipe.id}/{name}/')
+        self.assert_toggle(f'/api/users/{self.author.id}/subscribe/')
+        self.assertEqual(
+            self.client.post(f'/api/users/{self.reader.id}/subscribe/')
+            .status_code, 400
+        )
+
+    def test_repeated_add_counts_once(self):
+        url = f'/api/recipes/{self.recipes[0].id}/favorite/'
+        self.client.post(url)
+        self.client.post(url)
+        self.assertEqual(Favourite.objects.count(), 1)
+        self.recipes[0].refresh_from_db()
+        self.assertEqual(self.recipes[0].favourites_count, 1)
+
+    def test_bulk_results(self):
+        first, second = self.recipes
+        self.client.post(f'/api/recipes/{first.id}/favorite/')
+        ids = {'ids': [first.id, second.id, 999999]}
+        response = self.client.post('/api/recipes/favorite/', ids,
+                                    format='json')
+        self.assertEqual(response.data['results'], [
+            {'id': first.id, 'status': 'exists'},
+            {'id': second.id, 'status': 'created'},
+            {'id': 999999, 'status': 'not_found'},
+        ])
+        self.client.delete(f'/api/recipes/{first.id}/favorite/')
+        response = self.client.delete('/api/recipes/favorite/', ids,
+                                      format='json')
+        self.assertEqual(response.data['results'], [
+            {'id': first.id, 'status': 'missing'},
+            {'id': second.id, 'status': 'deleted'},
+            {'id': 999999, 'status': 'not_found'},
+        ])
+        response = self.client.post('/api/users/subscribe/', {
+            'ids': [self.author.id, self.reader.id]
+        }, format='json')
+        self.assertEqual(response.data['results'], [
+            {'id': self.author.id, 'status': 'created'},
+            {'id': self.reader.id, 'status': 'not_found'},
+        ])
+
+
+class FeedTest(TestCase):
+    """Лента рецептов авторов из подписок."""
+
+    def setUp(self):
+        cache.clear()
+        self.author = create_user('author')
+        self.other = create_user('other')
+        self.reader = create_user('reader')
+        self.recipes = create_recipes(self.author, 2)
+        create_recipes(self.other, 1)
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def feed(self):
+        response = self.client.get('/api/recipes/feed/')
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def cached_feed(self):
+        return cache.get(f'{FEED_CACHE_PREFIX}:{self.reader.id}')[0]
+
+    def subscribe(self, method='post'):
+        with self.captureOnCommitCallbacks(execute=True):
+            getattr(self.client, method)(
+                f'/api/users/{self.author.id}/subscribe/'
+            )
+
+    def test_follow_and_unfollow(self):
+        self.assertEqual(self.feed(), [])
+        self.subscribe()
+        expected = [recipe.id for recipe in reversed(self.recipes)]
+        self.assertEqual(self.feed(), expected)
+        self.subscribe('delete')
+        self.assertEqual(self.feed(), [])
+
+    def test_new_recipe_pushed_to_cached_feed(self):
+        self.subscribe()
+        self.feed()
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = create_recipes(self.author, 1)[0]
+            create_recipes(self.other, 1)
+        self.assertEqual(self.cached_feed()[0], recipe.id)
+        self.assertEqual(self.feed()[0], recipe.id)
+        self.assertEqual(len(self.cached_feed()), 3)
+
+    def test_deleted_recipe_removed(self):
+        self.subscribe()
+        self.feed()
+        deleted = self.recipes[1]
+        with self.captureOnCommitCallbacks(execute=True):
+            deleted.delete()
+        self.assertNotIn(deleted.id, self.cached_feed())
+        self.assertEqual(self.feed(), [self.recipes[0].id])
+
+
+class SubscriptionsTest(TestCase):
+    """Параметр recipes_limit в подписках."""
+
+    def setUp(self):
+        cache.clear()
+        self.author = create_user('author')
+        self.reader = create_user('reader')
+        create_recipes(self.author, 3)
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def test_recipes_limit(self):
+        response = self.client.post(
+            f'/api/users/{self.author.id}/subscribe/?recipes_limit=2'
+        )
+        self.assertEqual(len(response.data['recipes']), 2)
+        response = self.client.get(
+            '/api/users/subscriptions/?recipes_limit=1'
+        )
+        self.assertEqual(len(response.data['results'][0]['recipes']), 1)
+        self.assertEqual(response.data['results'][0]['recipes_count'], 3)
+
+    def test_invalid_recipes_limit(self):
+        for value in ('abc', '0', '-1', '1000'):
+            response = self.client.get(
+                f'/api/users/subscriptions/?recipes_limit={value}'
+            )
+            self.assertEqual(response.status_code, 400, value)
+            self.assertIn('recipes_limit', response.data)
+        response = self.client.post(
+            f'/api/users/{self.author.id}/subscribe/?recipes_limit=abc'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Follow.objects.exists())
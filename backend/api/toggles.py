@@ -0,0 +1,122 @@
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from recipes.signals import relations_changed
+
+BULK_MAX_IDS = 500
+
+
+def _table_sql(model, fields):
+    connection = connections[router.db_for_write(model)]
+    quote_name = connection.ops.quote_name
+    columns = ', '.join(
+        quote_name(model._meta.get_field(field).column) for field in fields
+    )
+    return connection, quote_name(model._meta.db_table), columns
+
+
+def _values_sql(pairs, width):
+    row = '(' + ', '.join(['%s'] * width) + ')'
+    params = [value for pair in pairs for value in pair]
+    return ', '.join([row] * len(pairs)), params
+
+
+def _auto_now_add_fields(model):
+    return [field for field in model._meta.concrete_fields
+            if getattr(field, 'auto_now_add', False)]
+
+
+def add_relations(model, fields, pairs):
+    """Добавляет пары одним INSERT ... ON CONFLICT DO NOTHING.
+
+    Возвращает только действительно вставленные пары, поэтому повтор
+    запроса ничего не меняет и не приводит к IntegrityError. Поля
+    auto_now_add заполняются текущим временем, как при save().
+    """
+    pairs = list(dict.fromkeys(pairs))
+    if not pairs:
+        return []
+    stamped = _auto_now_add_fields(model)
+    connection, table, columns = _table_sql(model, fields)
+    _, _, insert_columns = _table_sql(
+        model, [*fields, *(field.name for field in stamped)]
+    )
+    now = timezone.now()
+    stamps = tuple(field.get_db_prep_value(now, connection)
+                   for field in stamped)
+    values, params = _values_sql([pair + stamps for pair in pairs],
+                                 len(fields) + len(stamps))
+    with transaction.atomic(using=connection.alias):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} ({insert_columns}) VALUES {values} '
+                f'ON CONFLICT DO NOTHING RETURNING {columns}',
+                params
+            )
+            added = [tuple(row) for row in cursor.fetchall()]
+        if added:
+            relations_changed.send(sender=model, pairs=added, created=True)
+    return added
+
+
+def remove_relations(model, fields, pairs):
+    """Удаляет пары одним DELETE ... RETURNING, возвращает удалённые."""
+    pairs = list(dict.fromkeys(pairs))
+    if not pairs:
+        return []
+    connection, table, columns = _table_sql(model, fields)
+    values, params = _values_sql(pairs, len(fields))
+    with transaction.atomic(using=connection.alias):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {table} WHERE ({columns}) IN ({values}) '
+                f'RETURNING {columns}',
+                params
+            )
+            removed = [tuple(row) for row in cursor.fetchall()]
+        if removed:
+            relations_changed.send(sender=model, pairs=removed, created=False)
+    return removed
+
+
+def remove_user_relations(model, fields, user_id):
+    """Удаляет все пары пользователя одним DELETE ... RETURNING."""
+    connection, table, columns = _table_sql(model, fields)
+    user_column = connection.ops.quote_name(
+        model._meta.get_field(fields[0]).column
+    )
+    with transaction.atomic(using=connection.alias):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {table} WHERE {user_column} = %s '
+                f'RETURNING {columns}',
+                [user_id]
+            )
+            removed = [tuple(row) for row in cursor.fetchall()]
+        if removed:
+            relations_changed.send(sender=model, pairs=removed, created=False)
+    return removed
+
+
+def toggle_many(model, fields, user, ids, targets, add=True):
+    """Добавляет или удаляет пары user - id в одной транзакции.
+
+    targets - queryset допустимых объектов. Возвращает результат по
+    каждому id в порядке запроса.
+    """
+    ids = list(dict.fromkeys(ids))
+    found = set(targets.filter(id__in=ids).values_list('id', flat=True))
+    pairs = [(user.id, target_id) for target_id in ids if target_id in found]
+    with transaction.atomic():
+        if add:
+            changed = add_relations(model, fields, pairs)
+        else:
+            changed = remove_relations(model, fields, pairs)
+    changed = {target_id for _, target_id in changed}
+    done, skipped = ('created', 'exists') if add else ('deleted', 'missing')
+    return [
+        {'id': target_id,
+         'status': ('not_found' if target_id not in found
+                    else done if target_id in changed else skipped)}
+        for target_id in ids
+    ]
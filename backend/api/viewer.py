@@ -0,0 +1,90 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.functional import cached_property
+
+from recipes.models import Favourite, Follow, Purchase
+
+VIEWER_CACHE_PREFIX = 'viewer'
+
+VIEWER_SETS = {
+    'favourite_ids': (Favourite, 'user_id', 'recipe_id'),
+    'purchase_ids': (Purchase, 'user_id', 'recipe_id'),
+    'following_ids': (Follow, 'user_id', 'following_id'),
+}
+
+
+def _version_key(user_id, name):
+    return f'{VIEWER_CACHE_PREFIX}:{user_id}:{name}:version'
+
+
+def _load_ids(user_id, name):
+    model, user_field, value_field = VIEWER_SETS[name]
+    return frozenset(model.objects.filter(
+        **{user_field: user_id}
+    ).values_list(value_field, flat=True))
+
+
+def _get_ids(user_id, name):
+    timeout = settings.VIEWER_CONTEXT_TIMEOUT
+    if not timeout:
+        return _load_ids(user_id, name)
+    version = cache.get(_version_key(user_id, name), 0)
+    key = f'{VIEWER_CACHE_PREFIX}:{user_id}:{name}:{version}'
+    ids = cache.get(key)
+    if ids is None:
+        ids = _load_ids(user_id, name)
+        cache.set(key, ids, timeout)
+    return ids
+
+
+class ViewerContext:
+    """Избранное, покупки и подписки пользователя в виде множеств id."""
+
+    def __init__(self, user_id=None):
+        self.user_id = user_id
+
+    @cached_property
+    def favourite_ids(self):
+        return self._ids('favourite_ids')
+
+    @cached_property
+    def purchase_ids(self):
+        return self._ids('purchase_ids')
+
+    @cached_property
+    def following_ids(self):
+        return self._ids('following_ids')
+
+    def refresh(self, name):
+        """Забывает загруженное множество после записи в этом запросе."""
+        self.__dict__.pop(name, None)
+
+    def _ids(self, name):
+        if self.user_id is None:
+            return frozenset()
+        return _get_ids(self.user_id, name)
+
+
+def get_viewer_context(request):
+    """Контекст зрителя, загружаемый не чаще одного раза за запрос."""
+    if request is None or not request.user.is_authenticated:
+        return ViewerContext()
+    viewer = getattr(request, '_viewer_context', None)
+    if viewer is None or viewer.user_id != request.user.id:
+        viewer = ViewerContext(request.user.id)
+        request._viewer_context = viewer
+    return viewer
+
+
+def invalidate_viewer_context(user_id, name):
+    """Сбрасывает кэш множества после фиксации транзакции."""
+    if not settings.VIEWER_CONTEXT_TIMEOUT:
+        return
+
+    def bump_version():
+        key = _version_key(user_id, name)
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+    transaction.on_commit(bump_version)
@@ -1,46 +1,78 @@
-from django.db.models import Sum
+from django.conf import settings
+from django.http import StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
-from django.shortcuts import get_object_or_404, HttpResponse
+from django.shortcuts import get_object_or_404
 from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 # from rest_framework.views import APIView
 
-from .mixins import ListViewSet
+from .autocomplete import autocomplete_ingredients
+from .coverage import recipe_ingredient_index
+from .feed import get_feed_page
+from .mixins import (ListViewSet, RecipeCountMixin, ReferenceCacheMixin,
+                     ResponseCacheMixin)
 from .filters import IngredientFilter, RecipeFilter
 from recipes.models import (Favourite, Follow, Ingredient, Purchase, Recipe,
-                            RecipesIngredient, Tag)
+                            Tag)
+from .renderers import SHOPPING_LIST_RENDERERS
 from .permissions import (AuthorOrReadOnly, IsAdminIsAuthorOrReadOnly,
                           RoleAdminrOrReadOnly)
-from .serializers import (CustomUserSerializer, FavouriteSerializer,
-                          FollowSerializer, FollowListSerializer,
-                          IngredientSerializer, PurchaseSerializer,
+from .recipe_cache import get_recipe_versions
+from .serializers import (AutocompleteQuerySerializer, BulkIdsSerializer,
+                          CoverageQuerySerializer, CustomUserSerializer,
+                          FeedQuerySerializer, FollowListSerializer,
+                          IngredientRecipeCountSerializer,
+                          IngredientSerializer,
+                          RecipeCoverageSerializer,
                           RecipeCreateUpdateSerializer,
-                          RecipeSerializer, TagSerializer)
+                          RecipeFollowSerializer, RecipeSerializer,
+                          SubscriptionsQuerySerializer,
+                          TagRecipeCountSerializer, TagSerializer)
+from .shopping_list import stream_shopping_list
+from .toggles import (add_relations, remove_relations,
+                      remove_user_relations, toggle_many)
+from .viewer import get_viewer_context
 from users.models import User
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(RecipeCountMixin, ReferenceCacheMixin,
+                 viewsets.ReadOnlyModelViewSet):
     """API для работы с тэгами."""
 
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
+    recipe_count_serializer_class = TagRecipeCountSerializer
     permission_classes = (RoleAdminrOrReadOnly,)
     pagination_class = None
+    reference_name = 'tags'
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(RecipeCountMixin, ReferenceCacheMixin,
+                        viewsets.ReadOnlyModelViewSet):
     """API для работы с ингредиентами."""
 
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
+    recipe_count_serializer_class = IngredientRecipeCountSerializer
     permission_classes = (RoleAdminrOrReadOnly,)
     pagination_class = None
+    reference_name = 'ingredients'
     filter_backends = (DjangoFilterBackend,)
     filterset_class = IngredientFilter
 
+    @action(detail=False, methods=['get'])
+    def autocomplete(self, request):
+        serializer = AutocompleteQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return Response(autocomplete_ingredients(
+            serializer.validated_data['name'],
+            serializer.validated_data['limit'],
+        ))
 
-class RecipeViewSet(viewsets.ModelViewSet):
+
+class RecipeViewSet(ResponseCacheMixin, viewsets.ModelViewSet):
     """API для работы с рецептами."""
 
     queryset = Recipe.objects.all()
@@ -48,6 +80,28 @@ class RecipeViewSet(viewsets.ModelViewSet):
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
     http_method_names = ['get', 'post', 'patch', 'delete']
+    cache_name = 'recipes'
+    cache_per_user = True
+
+    @property
+    def cache_timeout(self):
+        return settings.RECIPE_CACHE_TIMEOUT
+
+    def get_cache_versions(self):
+        return get_recipe_versions(
+            recipe_id=self.kwargs.get(self.lookup_field),
+            viewer_id=self.get_cache_viewer(),
+            ordering=self.request.query_params.get('ordering'),
+        )
+
+    def get_queryset(self):
+        return Recipe.objects.with_related()
+
+    def count_depends_on_viewer(self):
+        return self.request.user.is_authenticated and any(
+            name in self.request.query_params
+            for name in ('is_favorited', 'is_in_shopping_cart')
+        )
 
     def get_serializer_class(self):
         if self.request.method in permissions.SAFE_METHODS:
@@ -57,29 +111,102 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    def toggle_recipe(self, request, pk, model, viewer_set, errors):
+        recipe = get_object_or_404(Recipe, id=pk)
+        pair = (request.user.id, recipe.id)
+        if request.method == 'POST':
+            if not add_relations(model, ('user', 'recipe'), [pair]):
+                return Response({'errors': errors['exists']},
+                                status=status.HTTP_400_BAD_REQUEST)
+            get_viewer_context(request).refresh(viewer_set)
+            serializer = RecipeFollowSerializer(recipe,
+                                                context={'request': request})
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        if not remove_relations(model, ('user', 'recipe'), [pair]):
+            return Response({'errors': errors['missing']},
+                            status=status.HTTP_400_BAD_REQUEST)
+        get_viewer_context(request).refresh(viewer_set)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def toggle_recipes(self, request, model, viewer_set):
+        serializer = BulkIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = toggle_many(
+            model, ('user', 'recipe'), request.user,
+            serializer.validated_data['ids'], Recipe.objects.all(),
+            add=request.method == 'POST'
+        )
+        get_viewer_context(request).refresh(viewer_set)
+        return Response({'results': results})
+
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=[permissions.IsAuthenticated, ]
+    )
+    def feed(self, request):
+        """Новые рецепты авторов из подписок, по убыванию id."""
+        serializer = FeedQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        ids, has_next = get_feed_page(
+            request.user.id,
+            get_viewer_context(request).following_ids,
+            **serializer.validated_data
+        )
+        recipes = Recipe.objects.with_related().in_bulk(ids)
+        serializer = RecipeSerializer(
+            [recipes[pk] for pk in ids if pk in recipes],
+            many=True, context={'request': request}
+        )
+        next_url = None
+        if has_next:
+            next_url = replace_query_param(request.build_absolute_uri(),
+                                           'before', ids[-1])
+        return Response({'next': next_url, 'results': serializer.data})
+
+    @action(detail=False, methods=['get'])
+    def by_ingredients(self, request):
+        """Рецепты, которые можно приготовить из имеющихся продуктов."""
+        serializer = CoverageQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        page = self.paginate_queryset(
+            recipe_ingredient_index.match(**serializer.validated_data)
+        )
+        recipes = Recipe.objects.with_related().in_bulk(
+            [match.recipe_id for match in page]
+        )
+        ranked = []
+        for match in page:
+            recipe = recipes.get(match.recipe_id)
+            if recipe is None:
+                continue
+            recipe.matched = match.matched
+            recipe.missing = match.missing
+            recipe.coverage = match.coverage
+            ranked.append(recipe)
+        serializer = RecipeCoverageSerializer(ranked, many=True,
+                                              context={'request': request})
+        return self.get_paginated_response(serializer.data)
+
     @action(
         detail=True,
         methods=['post', 'delete'],
         permission_classes=[permissions.IsAuthenticated, ]
     )
     def favorite(self, request, pk):
-        recipe = get_object_or_404(Recipe, id=pk)
-        if request.method == 'POST':
-            serializer = FavouriteSerializer(
-                data={'user': request.user.id, 'recipe': recipe.id},
-                context={'request': request}
-            )
-            if serializer.is_valid():
-                serializer.save()
-                return Response(serializer.data,
-                                status=status.HTTP_201_CREATED)
-            return Response(serializer.errors,
-                            status=status.HTTP_400_BAD_REQUEST)
-        if not Favourite.objects.filter(user=request.user,
-                                        recipe=recipe).exists():
-            return Response(status=status.HTTP_400_BAD_REQUEST)
-        Favourite.objects.filter(user=request.user, recipe=recipe).delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        return self.toggle_recipe(request, pk, Favourite, 'favourite_ids', {
+            'exists': 'Рецепт уже в избранном',
+            'missing': 'Рецепта нет в избранном',
+        })
+
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        url_path='favorite',
+        permission_classes=[permissions.IsAuthenticated, ]
+    )
+    def favorite_many(self, request):
+        return self.toggle_recipes(request, Favourite, 'favourite_ids')
 
     @action(
         detail=True,
@@ -87,44 +214,51 @@ class RecipeViewSet(viewsets.ModelViewSet):
         permission_classes=[permissions.IsAuthenticated, ]
     )
     def shopping_cart(self, request, pk):
-        recipe = get_object_or_404(Recipe, id=pk)
-        if request.method == 'POST':
-            serializer = PurchaseSerializer(
-                data={'user': request.user.id, 'recipe': recipe.id},
-                context={'request': request}
-            )
-            if serializer.is_valid():
-                serializer.save()
-                return Response(serializer.data,
-                                status=status.HTTP_201_CREATED)
-            return Response(serializer.errors,
-                            status=status.HTTP_400_BAD_REQUEST)
-        if not Purchase.objects.filter(user=request.user,
-                                       recipe=recipe).exists():
-            return Response(status=status.HTTP_400_BAD_REQUEST)
-        Purchase.objects.filter(user=request.user, recipe=recipe).delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        return self.toggle_recipe(request, pk, Purchase, 'purchase_ids', {
+            'exists': 'Рецепт уже в списке покупок',
+            'missing': 'Рецепта нет в списке покупок',
+        })
 
     @action(
         detail=False,
-        methods=['get'],
+        methods=['post', 'delete'],
+        url_path='shopping_cart',
+        permission_classes=[permissions.IsAuthenticated, ]
+    )
+    def shopping_cart_many(self, request):
+        return self.toggle_recipes(request, Purchase, 'purchase_ids')
+
+    @action(
+        detail=False,
+        methods=['delete'],
+        url_path='shopping_cart/clear',
         permission_classes=[permissions.IsAuthenticated, ]
     )
+    def clear_shopping_cart(self, request):
+        removed = remove_user_relations(Purchase, ('user', 'recipe'),
+                                        request.user.id)
+        get_viewer_context(request).refresh('purchase_ids')
+        return Response({'deleted': len(removed)})
+
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=[permissions.IsAuthenticated, ],
+        renderer_classes=SHOPPING_LIST_RENDERERS
+    )
     def download_shopping_cart(self, request):
-        ingredients = RecipesIngredient.objects.filter(
-            recipe__purchases__user=request.user
-        ).values(
-            'ingredient__name', 'ingredient__measurement_unit'
-        ).annotate(amount=Sum('amount'))
-        shopping_list = ['Список покупок:\n']
-        for ingredient in ingredients:
-            name = ingredient['ingredient__name']
-            measure = ingredient['ingredient__measurement_unit']
-            amount = ingredient['amount']
-            shopping_list.append(f'\n{name} - {amount} {measure}')
-        response = HttpResponse(shopping_list, content_type='text/plain')
-        response['Content-Disposition'] = ('attachment;'
-                                           'filename="shopping_cart.txt"')
+        renderer = request.accepted_renderer
+        file_format = renderer.format
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type = f'{content_type}; charset={renderer.charset}'
+        response = StreamingHttpResponse(
+            stream_shopping_list(request.user, file_format),
+            content_type=content_type,
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_cart.{file_format}"'
+        )
         return response
 
 
@@ -135,6 +269,16 @@ class UserListViewSet(ListViewSet):
     serializer_class = CustomUserSerializer
     permission_classes = (AuthorOrReadOnly,)
 
+    def count_depends_on_viewer(self):
+        return self.action == 'subscriptions'
+
+    def get_recipes_limit(self):
+        serializer = SubscriptionsQuerySerializer(
+            data=self.request.query_params
+        )
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data.get('recipes_limit')
+
     @action(
         detail=True,
         methods=['post', 'delete'],
@@ -142,32 +286,58 @@ class UserListViewSet(ListViewSet):
     )
     def subscribe(self, request, pk):
         following = get_object_or_404(User, id=pk)
+        pair = (request.user.id, following.id)
         if request.method == 'POST':
-            serializer = FollowSerializer(
-                data={'user': request.user.id, 'following': following.id},
-                context={'request': request}
-            )
-            if serializer.is_valid():
-                serializer.save()
-                return Response(serializer.data,
-                                status=status.HTTP_201_CREATED)
-            return Response(serializer.errors,
+            if following == request.user:
+                return Response({'errors': 'Нельзя подписаться на себя'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            recipes_limit = self.get_recipes_limit()
+            if not add_relations(Follow, ('user', 'following'), [pair]):
+                return Response({'errors': 'Вы уже подписаны на автора'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            get_viewer_context(request).refresh('following_ids')
+            serializer = FollowListSerializer(following, context={
+                'request': request, 'recipes_limit': recipes_limit,
+            })
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        if not remove_relations(Follow, ('user', 'following'), [pair]):
+            return Response({'errors': 'Вы не подписаны на автора'},
                             status=status.HTTP_400_BAD_REQUEST)
-        if not Follow.objects.filter(user=request.user,
-                                     following=following).exists():
-            return Response(status=status.HTTP_400_BAD_REQUEST)
-        Follow.objects.get(user=request.user,
-                           following=following).delete()
+        get_viewer_context(request).refresh('following_ids')
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        url_path='subscribe',
+        permission_classes=[permissions.IsAuthenticated, ]
+    )
+    def subscribe_many(self, request):
+        serializer = BulkIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = toggle_many(
+            Follow, ('user', 'following'), request.user,
+            serializer.validated_data['ids'],
+            User.objects.exclude(id=request.user.id),
+            add=request.method == 'POST'
+        )
+        get_viewer_context(request).refresh('following_ids')
+        return Response({'results': results})
+
     @action(
         detail=False,
         permission_classes=[permissions.IsAuthenticated, ]
     )
     def subscriptions(self, request):
-        queryset = User.objects.filter(following__user=self.request.user)
+        recipes_limit = self.get_recipes_limit()
+        queryset = User.objects.filter(
+            following__user=self.request.user
+        ).order_by('id')
         pages = self.paginate_queryset(queryset)
-        serializer = FollowListSerializer(pages,
-                                          many=True,
-                                          context={'request': request})
+        recipes_by_author = Recipe.objects.latest_by_author(
+            [author.id for author in pages], recipes_limit
+        )
+        serializer = FollowListSerializer(pages, many=True, context={
+            'request': request, 'recipes_by_author': recipes_by_author,
+        })
         return self.get_paginated_response(serializer.data)
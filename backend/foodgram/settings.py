@@ -106,6 +106,23 @@ DATABASES = {
     }
 }
 
+# Кэш: locmem - в памяти процесса (по умолчанию, для разработки и тестов),
+# file - в каталоге CACHE_LOCATION, общий для процессов на одной машине,
+# redis - общий для всех процессов (CACHE_LOCATION=redis://host:6379/0),
+# нужен в продакшене: версии кэшей сбрасываются записью в кэш.
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django_redis.cache.RedisCache',
+}
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'locmem')
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND],
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -163,6 +180,53 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 6,
 }
 
+# Сколько секунд кэшировать общее количество для постраничной выдачи
+# (по каждому набору фильтров) и с какого размера таблицы без фильтров
+# брать оценку планировщика PostgreSQL вместо COUNT(*).
+COUNT_CACHE_TIMEOUT = int(os.getenv('COUNT_CACHE_TIMEOUT', 30))
+COUNT_ESTIMATE_THRESHOLD = int(os.getenv('COUNT_ESTIMATE_THRESHOLD', 100000))
+
+# Наибольший ?limit для keyset-пагинации (?pagination=cursor).
+MAX_CURSOR_PAGE_LIMIT = int(os.getenv('MAX_CURSOR_PAGE_LIMIT', 100))
+
+# За сколько последних дней refresh_trending считает добавления в избранное
+# и списки покупок для сортировки ?ordering=trending.
+TRENDING_WINDOW_DAYS = int(os.getenv('TRENDING_WINDOW_DAYS', 7))
+
+# Сколько последних рецептов из подписок держать в кэше ленты пользователя
+# и сколько секунд хранить ленту без обращений.
+FEED_CACHE_SIZE = int(os.getenv('FEED_CACHE_SIZE', 500))
+FEED_CACHE_TIMEOUT = int(os.getenv('FEED_CACHE_TIMEOUT', 3600))
+
+# Наибольший размер картинки рецепта после декодирования base64, в байтах.
+# Тело JSON-запроса с такой картинкой примерно на треть больше.
+MAX_IMAGE_UPLOAD_SIZE = int(os.getenv('MAX_IMAGE_UPLOAD_SIZE',
+                                      5 * 1024 * 1024))
+DATA_UPLOAD_MAX_MEMORY_SIZE = MAX_IMAGE_UPLOAD_SIZE * 4 // 3 + 1024 * 1024
+
+# Сколько потоков строят уменьшенные копии картинок.
+# 0 - строить сразу после сохранения рецепта.
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+
+# Шрифт с кириллицей для выгрузки списка покупок в PDF.
+PDF_FONT_PATH = os.getenv(
+    'PDF_FONT_PATH', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
+# Время жизни кэша избранного, покупок и подписок пользователя между
+# запросами, в секундах. 0 - загружать заново в каждом запросе.
+VIEWER_CONTEXT_TIMEOUT = int(os.getenv('VIEWER_CONTEXT_TIMEOUT', 0))
+
+# Время жизни закэшированных ответов справочников (тэги, ингредиенты).
+# Версия справочника меняется при любой записи, так что это лишь
+# верхняя граница устаревания для кэша, не общего между процессами.
+REFERENCE_CACHE_TIMEOUT = int(os.getenv('REFERENCE_CACHE_TIMEOUT', 3600))
+
+# Время жизни закэшированных ответов списка и страниц рецептов. Ответы
+# авторизованных пользователей кэшируются отдельно для каждого из них.
+# 0 - не кэшировать.
+RECIPE_CACHE_TIMEOUT = int(os.getenv('RECIPE_CACHE_TIMEOUT', 300))
+
 DJOSER = {
     'LOGIN_FIELD': 'email',
     'HIDE_USERS': False,
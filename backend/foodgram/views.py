@@ -0,0 +1,36 @@
+import os
+import posixpath
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.utils.cache import patch_cache_control
+from django.utils._os import safe_join
+from django.views.decorators.http import condition
+from django.views.static import serve
+
+from recipes.storage import is_content_addressed
+
+# Неизменяемые файлы кэшируются на год, как в infra/nginx.conf.
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def media_etag(request, path, document_root=None, **kwargs):
+    """ETag из времени изменения и размера файла, как у nginx."""
+    try:
+        stat = os.stat(safe_join(
+            document_root, posixpath.normpath(path).lstrip('/')
+        ))
+    except (OSError, SuspiciousFileOperation):
+        return None
+    return f'{int(stat.st_mtime):x}-{stat.st_size:x}'
+
+
+@condition(etag_func=media_etag)
+def serve_media(request, path, document_root=None):
+    """Раздаёт media в DEBUG с ETag и заголовками кэширования."""
+    response = serve(request, path, document_root)
+    if is_content_addressed(path) or 'v' in request.GET:
+        patch_cache_control(response, public=True,
+                            max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, no_cache=True)
+    return response
@@ -1,7 +1,8 @@
 from django.contrib import admin
 
-from .models import (Favourite, Follow, Ingredient, Purchase, Recipe,
-                     RecipesIngredient, Tag)
+from .models import (CartIngredient, Favourite, Follow, Ingredient, Purchase,
+                     Recipe, RecipesIngredient, Tag)
+from .search import update_search_index
 
 
 class IngredientAdmin(admin.ModelAdmin):
@@ -29,15 +30,20 @@ class IngredientInline(MinValidatedInlineMixIn, admin.TabularInline):
 
 
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('pk', 'name', 'author', 'favourites_count')
-    readonly_fields = ('favourites_count',)
+    list_display = ('pk', 'name', 'author', 'favourites_count',
+                    'purchases_count')
+    readonly_fields = ('favourites_count', 'purchases_count')
     search_fields = ('name', 'author')
     list_filter = ('name', 'author', 'tags')
     empty_value_display = '-пусто-'
     inlines = (IngredientInline,)
 
-    def favourites_count(self, obj):
-        return Favourite.objects.filter(recipe=obj).count()
+    def save_related(self, request, form, formsets, change):
+        old_amounts = form.instance.ingredient_amounts() if change else {}
+        super().save_related(request, form, formsets, change)
+        if change:
+            CartIngredient.objects.update_recipe(form.instance, old_amounts)
+        update_search_index([form.instance.id])
 
 
 admin.site.register(Tag)
@@ -47,3 +53,4 @@ admin.site.register(RecipesIngredient)
 admin.site.register(Follow)
 admin.site.register(Favourite)
 admin.site.register(Purchase)
+admin.site.register(CartIngredient)
@@ -0,0 +1,49 @@
+from collections import defaultdict
+
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Favourite, Follow, Purchase, Recipe
+from users.models import User
+
+# Денормализованные счётчики: модель и её поле, затем модель связей и
+# поле, которым связь ссылается на владельца счётчика.
+COUNTERS = (
+    (Recipe, 'favourites_count', Favourite, 'recipe'),
+    (Recipe, 'purchases_count', Purchase, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Follow, 'following'),
+)
+
+COUNTER_BY_RELATION = {
+    related_model: (model, field, related_field)
+    for model, field, related_model, related_field in COUNTERS
+}
+
+
+def change_counters(model, field, deltas):
+    """Прибавляет deltas {id: изменение} одним UPDATE с F() на значение.
+
+    Не опускает счётчик ниже нуля, если он успел разойтись с данными.
+    """
+    ids_by_delta = defaultdict(list)
+    for pk, delta in deltas.items():
+        if delta:
+            ids_by_delta[delta].append(pk)
+    output_field = model._meta.get_field(field)
+    for delta, ids in ids_by_delta.items():
+        model.objects.filter(id__in=ids).update(**{
+            field: Greatest(F(field) + delta, 0, output_field=output_field)
+        })
+
+
+def count_relations(related_model, related_field):
+    """Точное значение счётчика подзапросом для каждой строки."""
+    return Coalesce(Subquery(
+        related_model.objects.filter(
+            **{related_field: OuterRef('pk')}
+        ).order_by().values(related_field).annotate(
+            total=Count('pk')
+        ).values('total'),
+        output_field=IntegerField(),
+    ), 0)
@@ -0,0 +1,197 @@
+import base64
+import binascii
+import io
+import logging
+import posixpath
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from django.template.defaultfilters import filesizeformat
+from PIL import Image, ImageOps
+
+from .storage import is_content_addressed
+
+logger = logging.getLogger(__name__)
+
+ALLOWED_FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
+MAX_IMAGE_PIXELS = 40_000_000
+# Декодируем base64 кусками, кратными четырём символам.
+DECODE_CHUNK = 64 * 1024
+# Уменьшенные копии в WebP: имя и наибольшая сторона в пикселях.
+VARIANTS = {
+    'thumbnail': 320,
+    'medium': 960,
+}
+VARIANT_QUALITY = 80
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def check_image(file):
+    """Проверяет картинку Pillow, возвращает расширение по её формату."""
+    file.seek(0)
+    try:
+        with Image.open(file) as image:
+            image_format = image.format
+            width, height = image.size
+            image.verify()
+    except (OSError, SyntaxError, Image.DecompressionBombError):
+        raise ValidationError('Загрузите правильное изображение.')
+    finally:
+        file.seek(0)
+    if image_format not in ALLOWED_FORMATS:
+        raise ValidationError(f'Формат {image_format} не поддерживается.')
+    if width * height > MAX_IMAGE_PIXELS:
+        raise ValidationError('Слишком большое разрешение изображения.')
+    return ALLOWED_FORMATS[image_format]
+
+
+def decode_base64_image(data):
+    """Декодирует data:image/...;base64 по частям с лимитом размера.
+
+    Возвращает File во временном файле, имя - по настоящему формату.
+    """
+    limit = settings.MAX_IMAGE_UPLOAD_SIZE
+    too_large = f'Изображение больше {filesizeformat(limit)}.'
+    encoded = data.partition(';base64,')[2]
+    if not encoded:
+        raise ValidationError('Ожидается изображение в base64.')
+    if len(encoded) * 3 // 4 > limit + 3:
+        raise ValidationError(too_large)
+    file = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    try:
+        for start in range(0, len(encoded), DECODE_CHUNK):
+            file.write(base64.b64decode(
+                encoded[start:start + DECODE_CHUNK], validate=True
+            ))
+            if file.tell() > limit:
+                raise ValidationError(too_large)
+    except binascii.Error:
+        file.close()
+        raise ValidationError('Изображение повреждено: неверный base64.')
+    except ValidationError:
+        file.close()
+        raise
+    extension = check_image(file)
+    return File(file, name=f'temp.{extension}')
+
+
+def variant_name(variant):
+    """Каталог и расширение копии: recipes/<вариант>/<вариант>.webp.
+
+    Имя файла хранилище всё равно заменит на хэш содержимого.
+    """
+    from .models import Recipe
+
+    upload_to = Recipe._meta.get_field('image').upload_to
+    return posixpath.join(upload_to, variant, f'{variant}.webp')
+
+
+def render_variant(image, size):
+    variant = ImageOps.exif_transpose(image)
+    if variant.mode not in ('RGB', 'RGBA'):
+        variant = variant.convert('RGBA' if 'transparency' in variant.info
+                                  else 'RGB')
+    variant.thumbnail((size, size), Image.LANCZOS)
+    buffer = io.BytesIO()
+    variant.save(buffer, 'WEBP', quality=VARIANT_QUALITY, method=4)
+    return buffer.getvalue()
+
+
+def generate_variants(recipe_id, source_name):
+    """Строит уменьшенные копии картинки и записывает их в рецепт.
+
+    Если картинку рецепта за это время заменили, ничего не записывает.
+    """
+    from .models import Recipe
+    from .signals import recipes_updated
+
+    storage = Recipe._meta.get_field('image').storage
+    with storage.open(source_name, 'rb') as source, \
+            Image.open(source) as image:
+        image.load()
+        variants = {'source': source_name}
+        for variant, size in VARIANTS.items():
+            variants[variant] = storage.save(
+                variant_name(variant), ContentFile(render_variant(image, size))
+            )
+    updated = Recipe.objects.filter(
+        pk=recipe_id, image=source_name
+    ).update(image_variants=variants)
+    if updated:
+        recipes_updated.send(sender=Recipe, recipe_ids=[recipe_id])
+    return updated
+
+
+def _run(recipe_id, source_name, in_worker=True):
+    try:
+        generate_variants(recipe_id, source_name)
+    except Exception:
+        logger.exception('Не удалось построить копии картинки %s',
+                         source_name)
+    finally:
+        if in_worker:
+            connections.close_all()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_WORKERS,
+                thread_name_prefix='image-variants',
+            )
+        return _executor
+
+
+def schedule_variants(recipe):
+    """После фиксации транзакции ставит построение копий в пул потоков.
+
+    IMAGE_WORKERS=0 - строить сразу в текущем потоке.
+    """
+    recipe_id, source_name = recipe.pk, recipe.image.name
+
+    def submit():
+        if not settings.IMAGE_WORKERS:
+            _run(recipe_id, source_name, in_worker=False)
+            return
+        _get_executor().submit(_run, recipe_id, source_name)
+
+    transaction.on_commit(submit)
+
+
+def versioned_url(storage, name):
+    """URL файла, который меняется вместе с содержимым.
+
+    Имена из хэша уже неизменяемы; к старым именам добавляется
+    ?v=<время изменения файла>.
+    """
+    url = storage.url(name)
+    if is_content_addressed(name):
+        return url
+    try:
+        modified = storage.get_modified_time(name)
+    except OSError:
+        return url
+    return f'{url}?v={int(modified.timestamp())}'
+
+
+def variant_urls(recipe):
+    """URL копий картинки; пока копии не готовы - URL оригинала."""
+    if not recipe.image:
+        return {variant: None for variant in VARIANTS}
+    variants = recipe.image_variants or {}
+    storage = recipe.image.storage
+    if variants.get('source') != recipe.image.name:
+        url = versioned_url(storage, recipe.image.name)
+        return {variant: url for variant in VARIANTS}
+    return {variant: versioned_url(storage, variants[variant])
+            for variant in VARIANTS}
@@ -0,0 +1,102 @@
+import posixpath
+from datetime import timedelta
+
+from django.core.management import BaseCommand
+from django.utils import timezone
+
+from recipes.images import VARIANTS
+from recipes.models import Recipe
+
+
+def walk(storage, directory):
+    """Все файлы каталога хранилища, включая вложенные."""
+    directories, files = storage.listdir(directory)
+    for name in files:
+        yield posixpath.join(directory, name)
+    for name in directories:
+        yield from walk(storage, posixpath.join(directory, name))
+
+
+class Command(BaseCommand):
+    help = ('Удаляет картинки и их копии, на которые не ссылается '
+            'ни один рецепт.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Сколько файлов проверять и удалять за один проход.',
+        )
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=60,
+            help=('Не трогать файлы моложе стольких минут: их рецепт '
+                  'может быть ещё не сохранён.'),
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать файлы, ничего не удаляя.',
+        )
+
+    def referenced(self):
+        names = set()
+        for image, variants in Recipe.objects.exclude(image='').values_list(
+            'image', 'image_variants'
+        ).iterator():
+            names.add(image)
+            names.update(
+                name for variant, name in (variants or {}).items()
+                if variant in VARIANTS
+            )
+        return names
+
+    def collect(self, storage, batch, threshold, options):
+        # Перед удалением ещё раз проверяем оригиналы: рецепт мог получить
+        # картинку, пока мы обходили каталог. Повторная загрузка того же
+        # содержимого обновляет время изменения ещё до сохранения рецепта.
+        batch = set(batch) - set(Recipe.objects.filter(
+            image__in=batch
+        ).values_list('image', flat=True))
+        deleted = 0
+        for name in sorted(batch):
+            try:
+                if storage.get_modified_time(name) > threshold:
+                    continue
+            except FileNotFoundError:
+                continue
+            if options['dry_run']:
+                self.stdout.write(name)
+            else:
+                storage.delete(name)
+            deleted += 1
+        return deleted
+
+    def handle(self, *args, **options):
+        field = Recipe._meta.get_field('image')
+        storage = field.storage
+        upload_to = field.upload_to.rstrip('/')
+        if not storage.exists(upload_to):
+            self.stdout.write(self.style.SUCCESS('Картинок нет.'))
+            return
+        referenced = self.referenced()
+        threshold = timezone.now() - timedelta(minutes=options['min_age'])
+        deleted = 0
+        batch = []
+        for name in walk(storage, upload_to):
+            if name in referenced:
+                continue
+            if storage.get_modified_time(name) > threshold:
+                continue
+            batch.append(name)
+            if len(batch) >= options['batch_size']:
+                deleted += self.collect(storage, batch, threshold, options)
+                batch = []
+        if batch:
+            deleted += self.collect(storage, batch, threshold, options)
+        action = 'Найдено' if options['dry_run'] else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} лишних файлов: {deleted}'
+        ))
@@ -0,0 +1,37 @@
+from django.core.management import BaseCommand
+
+from recipes.images import generate_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Строит уменьшенные копии картинок рецептов, где их нет.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Перестроить копии у всех рецептов.',
+        )
+
+    def handle(self, *args, **options):
+        built = failed = 0
+        recipes = Recipe.objects.exclude(image='').only(
+            'id', 'image', 'image_variants'
+        ).order_by('id')
+        for recipe in recipes.iterator():
+            variants = recipe.image_variants or {}
+            if not options['all'] and (
+                variants.get('source') == recipe.image.name
+            ):
+                continue
+            try:
+                generate_variants(recipe.id, recipe.image.name)
+            except OSError as error:
+                failed += 1
+                self.stderr.write(f'Рецепт {recipe.id}: {error}')
+                continue
+            built += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Копии построены: {built}, ошибок: {failed}'
+        ))
@@ -1,26 +1,151 @@
 import csv
+import io
+import json
+from itertools import islice
+from pathlib import Path
 
 from django.conf import settings
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
 
 from recipes.models import Ingredient
+from recipes.signals import reference_data_changed
+
+FORMATS = ('csv', 'json')
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if row:
+            yield row
+
+
+def read_json(file):
+    for item in json.load(file):
+        yield item['name'], item['measurement_unit']
+
+
+READERS = {
+    'csv': read_csv,
+    'json': read_json,
+}
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
 
 
 class Command(BaseCommand):
-    help = 'Loads data from csv.'
-
-    def handle(self, *args, **kwargs):
-        data_path = settings.BASE_DIR
-        with open(
-            f'{data_path}/data/ingredients.csv',
-            'r',
-            encoding='utf-8'
-        ) as file:
-            rows = csv.reader(file)
-            for row in rows:
-                name, measurement_unit = row
-                Ingredient.objects.get_or_create(
-                    name=name,
-                    measurement_unit=measurement_unit
+    help = 'Loads ingredients from csv or json.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            default=Path(settings.BASE_DIR) / 'data' / 'ingredients.csv',
+            help='Путь к файлу с ингредиентами.',
+        )
+        parser.add_argument(
+            '--format',
+            choices=FORMATS,
+            help='Формат файла. По умолчанию - по расширению.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько строк отправлять в базу за раз.',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Посчитать новые ингредиенты, ничего не записывая.',
+        )
+
+    def read_rows(self, path, file_format):
+        """Уникальные пары (название, единица) в порядке файла."""
+        seen = set()
+        with open(path, 'r', encoding='utf-8') as file:
+            for name, measurement_unit in READERS[file_format](file):
+                key = (name.strip(), measurement_unit.strip())
+                if key in seen:
+                    self.duplicates += 1
+                    continue
+                seen.add(key)
+                yield key
+
+    def load_bulk(self, rows, batch_size, dry_run):
+        inserted = 0
+        for chunk in chunked(rows, batch_size):
+            existing = set(Ingredient.objects.filter(
+                name__in={name for name, _ in chunk}
+            ).values_list('name', 'measurement_unit'))
+            new = [key for key in chunk if key not in existing]
+            self.total += len(chunk)
+            inserted += len(new)
+            if not dry_run:
+                Ingredient.objects.bulk_create(
+                    [Ingredient(name=name, measurement_unit=unit)
+                     for name, unit in new],
+                    ignore_conflicts=True,
+                )
+        return inserted
+
+    def load_copy(self, rows, batch_size):
+        """COPY во временную таблицу и одна вставка без конфликтов."""
+        table = Ingredient._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMPORARY TABLE ingredient_import '
+                '(name varchar(200), measurement_unit varchar(200)) '
+                'ON COMMIT DROP'
+            )
+            for chunk in chunked(rows, batch_size):
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(chunk)
+                buffer.seek(0)
+                cursor.copy_expert(
+                    'COPY ingredient_import FROM STDIN WITH (FORMAT csv)',
+                    buffer,
+                )
+                self.total += len(chunk)
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                'SELECT name, measurement_unit FROM ingredient_import '
+                'ON CONFLICT (name, measurement_unit) DO NOTHING'
+            )
+            return cursor.rowcount
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        file_format = options['format'] or path.suffix.lstrip('.').lower()
+        if file_format not in FORMATS:
+            raise CommandError(f'Неизвестный формат файла: {path}')
+        if not path.exists():
+            raise CommandError(f'Файл не найден: {path}')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше нуля')
+        self.total = self.duplicates = 0
+        rows = self.read_rows(path, file_format)
+        with transaction.atomic():
+            if connection.vendor == 'postgresql' and not options['dry_run']:
+                inserted = self.load_copy(rows, options['batch_size'])
+            else:
+                inserted = self.load_bulk(
+                    rows, options['batch_size'], options['dry_run']
                 )
+        self.stdout.write(
+            f'Добавлено: {inserted}, уже были в базе: '
+            f'{self.total - inserted}, повторов в файле: {self.duplicates}'
+        )
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('Пробный запуск, '
+                                                 'база не изменена.'))
+            return
+        if inserted:
+            reference_data_changed.send(sender=Ingredient)
         self.stdout.write(self.style.SUCCESS('Ингредиенты загружены!'))
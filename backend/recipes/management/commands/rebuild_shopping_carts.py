@@ -0,0 +1,66 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+
+from recipes.models import CartIngredient, RecipesIngredient
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает списки покупок из рецептов в корзинах.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Только сравнить с пересчётом, ничего не меняя.',
+        )
+
+    def get_expected(self):
+        totals = RecipesIngredient.objects.filter(
+            recipe__purchases__isnull=False
+        ).values('recipe__purchases__user', 'ingredient').annotate(
+            total=Sum('amount')
+        ).order_by()
+        return {
+            (row['recipe__purchases__user'], row['ingredient']): row['total']
+            for row in totals.iterator()
+        }
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            expected = self.get_expected()
+            actual = {
+                (user_id, ingredient_id): amount
+                for user_id, ingredient_id, amount
+                in CartIngredient.objects.values_list(
+                    'user_id', 'ingredient_id', 'amount'
+                ).iterator()
+            }
+            mismatched = [key for key in expected.keys() | actual.keys()
+                          if expected.get(key) != actual.get(key)]
+            if options['verify']:
+                for user_id, ingredient_id in sorted(mismatched):
+                    self.stdout.write(
+                        f'user={user_id} ingredient={ingredient_id}: '
+                        f'ожидалось {expected.get((user_id, ingredient_id))}'
+                        f', в таблице {actual.get((user_id, ingredient_id))}'
+                    )
+                if mismatched:
+                    self.stdout.write(self.style.ERROR(
+                        f'Расхождений: {len(mismatched)}'
+                    ))
+                else:
+                    self.stdout.write(self.style.SUCCESS(
+                        'Списки покупок совпадают.'
+                    ))
+                return
+            CartIngredient.objects.all().delete()
+            CartIngredient.objects.bulk_create(
+                (CartIngredient(user_id=user_id, ingredient_id=ingredient_id,
+                                amount=amount)
+                 for (user_id, ingredient_id), amount in expected.items()),
+                batch_size=1000
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Списки покупок пересчитаны, исправлено строк: {len(mismatched)}'
+        ))
@@ -0,0 +1,51 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.db.models import F
+
+from recipes.counters import COUNTERS, count_relations
+
+
+class Command(BaseCommand):
+    help = 'Сверяет счётчики рецептов и пользователей с данными.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Только показать расхождения, ничего не меняя.',
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        with transaction.atomic():
+            for model, field, related_model, related_field in COUNTERS:
+                actual = count_relations(related_model, related_field)
+                drifted = model.objects.annotate(actual=actual).exclude(
+                    **{field: F('actual')}
+                ).order_by()
+                label = f'{model._meta.model_name}.{field}'
+                if options['verify']:
+                    for pk, stored, expected in drifted.values_list(
+                        'pk', field, 'actual'
+                    ).iterator():
+                        self.stdout.write(
+                            f'{label} id={pk}: ожидалось {expected}, '
+                            f'в таблице {stored}'
+                        )
+                        total += 1
+                    continue
+                fixed = model.objects.filter(
+                    pk__in=drifted.values('pk')
+                ).update(**{field: actual})
+                if fixed:
+                    self.stdout.write(f'{label}: исправлено {fixed}')
+                total += fixed
+        if options['verify']:
+            if total:
+                self.stdout.write(self.style.ERROR(f'Расхождений: {total}'))
+            else:
+                self.stdout.write(self.style.SUCCESS('Счётчики совпадают.'))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Счётчики сверены, исправлено строк: {total}'
+        ))
@@ -0,0 +1,51 @@
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from recipes.models import Favourite, Purchase, Recipe
+from recipes.signals import reference_data_changed
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает оценки для сортировки рецептов ?ordering=trending.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=settings.TRENDING_WINDOW_DAYS,
+            help='За сколько последних дней считать добавления.',
+        )
+
+    def handle(self, *args, **options):
+        if options['days'] < 1:
+            raise CommandError('--days должен быть больше нуля')
+        since = timezone.now() - timedelta(days=options['days'])
+        scores = Counter()
+        for model in (Favourite, Purchase):
+            for recipe_id, total in model.objects.filter(
+                created__gte=since
+            ).values('recipe').annotate(
+                total=Count('id')
+            ).values_list('recipe', 'total').order_by():
+                scores[recipe_id] += total
+        # Одна оценка - один UPDATE по списку id, как у счётчиков.
+        ids_by_score = defaultdict(list)
+        for recipe_id, score in scores.items():
+            ids_by_score[score].append(recipe_id)
+        with transaction.atomic():
+            Recipe.objects.filter(trend_score__gt=0).update(trend_score=0)
+            for score, ids in ids_by_score.items():
+                for start in range(0, len(ids), 1000):
+                    Recipe.objects.filter(
+                        pk__in=ids[start:start + 1000]
+                    ).update(trend_score=score)
+            reference_data_changed.send(sender=Recipe)
+        self.stdout.write(self.style.SUCCESS(
+            f'Оценки пересчитаны, рецептов с оценкой: {len(scores)}'
+        ))
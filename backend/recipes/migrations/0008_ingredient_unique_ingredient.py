@@ -0,0 +1,49 @@
+# Generated by Django 4.2.4 on 2026-10-18 12:30
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    RecipesIngredient = apps.get_model('recipes', 'RecipesIngredient')
+    CartIngredient = apps.get_model('recipes', 'CartIngredient')
+    groups = Ingredient.objects.values('name', 'measurement_unit').annotate(
+        keep_id=Min('id'), total=Count('id')
+    ).filter(total__gt=1).order_by()
+    for group in groups:
+        keep_id = group['keep_id']
+        duplicate_ids = list(Ingredient.objects.filter(
+            name=group['name'], measurement_unit=group['measurement_unit']
+        ).exclude(id=keep_id).values_list('id', flat=True))
+        RecipesIngredient.objects.filter(
+            ingredient_id__in=duplicate_ids
+        ).update(ingredient_id=keep_id)
+        for row in CartIngredient.objects.filter(
+            ingredient_id__in=duplicate_ids
+        ):
+            kept, created = CartIngredient.objects.get_or_create(
+                user_id=row.user_id, ingredient_id=keep_id,
+                defaults={'amount': row.amount}
+            )
+            if not created:
+                kept.amount += row.amount
+                kept.save(update_fields=['amount'])
+            row.delete()
+        Ingredient.objects.filter(id__in=duplicate_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_cartingredient'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_ingredients,
+                             migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient'),
+        ),
+    ]
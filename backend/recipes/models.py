@@ -1,9 +1,13 @@
+from collections import Counter, defaultdict
+
 from colorfield.fields import ColorField
+from django.contrib.postgres.search import SearchVectorField
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import connections, models, transaction
 
-from users.models import User
+from .storage import ContentAddressedStorage
+from users.models import DerivedFieldsMixin, User
 
 
 class Tag(models.Model):
@@ -35,12 +39,66 @@ class Ingredient(models.Model):
     class Meta:
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'measurement_unit'],
+                                    name='unique_ingredient')
+        ]
 
     def __str__(self):
         return f'{self.name} - {self.measurement_unit}'
 
 
-class Recipe(models.Model):
+class RecipeQuerySet(models.QuerySet):
+
+    def with_related(self):
+        """Автор, тэги и ингредиенты для выдачи без запросов на строку."""
+        return self.defer('search_vector').select_related(
+            'author'
+        ).prefetch_related(
+            'tags',
+            models.Prefetch(
+                'recipe_ingredients',
+                queryset=RecipesIngredient.objects.select_related(
+                    'ingredient'
+                )
+            )
+        )
+
+    def latest_by_author(self, author_ids, limit=None):
+        """По limit последних рецептов каждого автора одним запросом.
+
+        Возвращает {id автора: [рецепты по убыванию id]}; limit=None - все.
+        """
+        author_ids = list(author_ids)
+        by_author = defaultdict(list)
+        if not author_ids:
+            return by_author
+        if limit is None:
+            recipes = self.filter(author_id__in=author_ids).order_by('-id')
+        else:
+            quote_name = connections[self.db].ops.quote_name
+            columns = ', '.join(
+                quote_name(self.model._meta.get_field(name).column)
+                for name in ('id', 'author', 'name', 'image',
+                             'image_variants', 'cooking_time')
+            )
+            author = quote_name(self.model._meta.get_field('author').column)
+            recipes = self.raw(
+                f'SELECT {columns} FROM ('
+                f'SELECT {columns}, ROW_NUMBER() OVER ('
+                f'PARTITION BY {author} ORDER BY {quote_name("id")} DESC'
+                f') AS position '
+                f'FROM {quote_name(self.model._meta.db_table)} '
+                f'WHERE {author} IN ({", ".join(["%s"] * len(author_ids))})'
+                f') ranked WHERE position <= %s ORDER BY position',
+                [*author_ids, limit]
+            )
+        for recipe in recipes:
+            by_author[recipe.author_id].append(recipe)
+        return by_author
+
+
+class Recipe(DerivedFieldsMixin, models.Model):
     """Модель Рецепта."""
 
     author = models.ForeignKey(
@@ -51,7 +109,9 @@ class Recipe(models.Model):
     )
     name = models.CharField('Название', max_length=200)
     image = models.ImageField(
-        'Картинка', upload_to='recipes/')
+        'Картинка', upload_to='recipes/', storage=ContentAddressedStorage())
+    image_variants = models.JSONField(
+        'Копии картинки', default=dict, editable=False)
     text = models.TextField('Текст')
     ingredients = models.ManyToManyField(
         Ingredient,
@@ -70,15 +130,46 @@ class Recipe(models.Model):
             1,
             message='Нельзя готовить меньше 1 минуты!')]
     )
+    favourites_count = models.PositiveIntegerField(
+        'В избранном', default=0, editable=False)
+    purchases_count = models.PositiveIntegerField(
+        'В списках покупок', default=0, editable=False)
+    trend_score = models.PositiveIntegerField(
+        'Оценка популярности', default=0, editable=False)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    # Ведутся отдельными UPDATE: счётчики, оценка trending (пересчитывает
+    # refresh_trending), копии картинки, поисковый вектор.
+    derived_fields = ('favourites_count', 'purchases_count', 'trend_score',
+                      'image_variants', 'search_vector')
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-id',)
+        indexes = [
+            models.Index(fields=['-favourites_count', '-id'],
+                         name='recipe_popular_idx'),
+            models.Index(fields=['-trend_score', '-id'],
+                         name='recipe_trending_idx'),
+            models.Index(fields=['cooking_time', '-id'],
+                         name='recipe_cooking_time_idx'),
+        ]
 
     def __str__(self):
         return f'{self.name} - автор {self.author}'
 
+    def ingredient_amounts(self):
+        """Количество каждого ингредиента рецепта по его id."""
+        amounts = Counter()
+        for ingredient_id, amount in self.recipe_ingredients.values_list(
+            'ingredient_id', 'amount'
+        ):
+            amounts[ingredient_id] += amount
+        return amounts
+
 
 class RecipesIngredient(models.Model):
     """Модель ингредиента для рецепта."""
@@ -110,7 +201,46 @@ class RecipesIngredient(models.Model):
         return f'{self.ingredient.name} - {self.amount}'
 
 
-class Follow(models.Model):
+class RelationQuerySet(models.QuerySet):
+
+    def delete(self):
+        """Удаляет связи и сообщает об удалённых парах одним сигналом."""
+        from .signals import relations_changed
+
+        fields = [f'{name}_id' for name in self.model.relation_fields]
+        with transaction.atomic(using=self.db):
+            rows = list(self.order_by().select_for_update().values_list(
+                'pk', *fields
+            ))
+            deleted = self.model._base_manager.using(self.db).filter(
+                pk__in=[row[0] for row in rows]
+            ).delete()
+            if rows:
+                relations_changed.send(
+                    sender=self.model, pairs=[row[1:] for row in rows],
+                    created=False
+                )
+        return deleted
+
+
+class RelationMixin:
+    """Связь пользователя с рецептом или автором.
+
+    У связей нет сигналов удаления, поэтому каскад при удалении рецепта
+    или пользователя удаляет их одним DELETE, а списки покупок, счётчики
+    и кэши обновляет pre_delete рецепта или пользователя. Удаление через
+    ORM идёт через RelationQuerySet.delete().
+    """
+
+    relation_fields = ()
+
+    def delete(self, using=None, keep_parents=False):
+        return type(self)._default_manager.using(using).filter(
+            pk=self.pk
+        ).delete()
+
+
+class Follow(RelationMixin, models.Model):
     """Модель подписок."""
 
     user = models.ForeignKey(
@@ -126,6 +256,10 @@ class Follow(models.Model):
         verbose_name='Автор'
     )
 
+    relation_fields = ('user', 'following')
+
+    objects = RelationQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
@@ -151,12 +285,14 @@ class CreatedModel(models.Model):
         on_delete=models.CASCADE,
         verbose_name='Пользователь'
     )
+    created = models.DateTimeField(
+        'Добавлено', auto_now_add=True, db_index=True)
 
     class Meta:
         abstract = True
 
 
-class Favourite(CreatedModel):
+class Favourite(RelationMixin, CreatedModel):
     """Модель добавления рецепта в избранное."""
 
     recipe = models.ForeignKey(
@@ -166,6 +302,10 @@ class Favourite(CreatedModel):
         verbose_name='Избранный рецепт'
     )
 
+    relation_fields = ('user', 'recipe')
+
+    objects = RelationQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Избранное'
         verbose_name_plural = 'Избранные рецепты'
@@ -179,7 +319,7 @@ class Favourite(CreatedModel):
         return f'{self.user} добавил рецепт {self.recipe} в избранное'
 
 
-class Purchase(CreatedModel):
+class Purchase(RelationMixin, CreatedModel):
     """Модель списка покупок."""
 
     recipe = models.ForeignKey(
@@ -189,6 +329,10 @@ class Purchase(CreatedModel):
         verbose_name='Покупки'
     )
 
+    relation_fields = ('user', 'recipe')
+
+    objects = RelationQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Покупка'
         verbose_name_plural = 'Покупки'
@@ -199,3 +343,114 @@ class Purchase(CreatedModel):
 
     def __str__(self):
         return f'{self.user} добавил рецепт {self.recipe} в список покупок'
+
+
+class CartIngredientManager(models.Manager):
+    """Инкрементальное обновление списков покупок."""
+
+    def apply_delta(self, user_ids, delta):
+        """Прибавляет delta {id ингредиента: количество} к спискам."""
+        delta = {key: value for key, value in delta.items() if value}
+        user_ids = sorted(set(user_ids))
+        if not delta or not user_ids:
+            return
+        with transaction.atomic():
+            list(User.objects.select_for_update().filter(
+                id__in=user_ids
+            ).order_by('id').values_list('id', flat=True))
+            rows = {
+                (row.user_id, row.ingredient_id): row
+                for row in self.filter(user_id__in=user_ids,
+                                       ingredient_id__in=delta)
+            }
+            to_create, to_update, to_delete = [], [], []
+            for user_id in user_ids:
+                for ingredient_id, amount in delta.items():
+                    row = rows.get((user_id, ingredient_id))
+                    if row is None:
+                        if amount > 0:
+                            to_create.append(self.model(
+                                user_id=user_id,
+                                ingredient_id=ingredient_id,
+                                amount=amount
+                            ))
+                        continue
+                    row.amount += amount
+                    if row.amount > 0:
+                        to_update.append(row)
+                    else:
+                        to_delete.append(row.id)
+            self.bulk_create(to_create)
+            self.bulk_update(to_update, ['amount'])
+            self.filter(id__in=to_delete).delete()
+
+    def apply_purchases(self, purchases, sign=1):
+        """Добавляет (sign=1) или убирает (sign=-1) рецепты из списков.
+
+        purchases - пары (user_id, recipe_id).
+        """
+        purchases = list(purchases)
+        if not purchases:
+            return
+        amounts = defaultdict(Counter)
+        for recipe_id, ingredient_id, amount in (
+            RecipesIngredient.objects.filter(
+                recipe_id__in={recipe_id for _, recipe_id in purchases}
+            ).values_list('recipe_id', 'ingredient_id', 'amount')
+        ):
+            amounts[recipe_id][ingredient_id] += amount
+        deltas = defaultdict(Counter)
+        for user_id, recipe_id in purchases:
+            deltas[user_id].update(amounts[recipe_id])
+        # Одинаковые изменения (один рецепт у многих) - одной пачкой.
+        users_by_delta = defaultdict(list)
+        for user_id, delta in deltas.items():
+            users_by_delta[frozenset(delta.items())].append(user_id)
+        for delta, user_ids in users_by_delta.items():
+            self.apply_delta(user_ids, {
+                ingredient_id: sign * amount
+                for ingredient_id, amount in delta
+            })
+
+    def apply_recipe_delta(self, recipe, delta):
+        """Переносит изменение ингредиентов рецепта в списки покупок."""
+        if not any(delta.values()):
+            return
+        user_ids = list(recipe.purchases.values_list('user_id', flat=True))
+        self.apply_delta(user_ids, delta)
+
+    def update_recipe(self, recipe, old_amounts):
+        delta = recipe.ingredient_amounts()
+        delta.subtract(old_amounts)
+        self.apply_recipe_delta(recipe, delta)
+
+
+class CartIngredient(models.Model):
+    """Суммарное количество ингредиента в списке покупок пользователя."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='cart_ingredients',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='cart_ingredients',
+        verbose_name='Продукт'
+    )
+    amount = models.PositiveIntegerField('Количество')
+
+    objects = CartIngredientManager()
+
+    class Meta:
+        verbose_name = 'Ингредиент в списке покупок'
+        verbose_name_plural = 'Ингредиенты в списке покупок'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'ingredient'],
+                                    name='unique_cart_ingredient')
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.ingredient} - {self.amount}'
@@ -0,0 +1,40 @@
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchVector
+from django.db import connection
+from django.db.models import OuterRef, Subquery, TextField
+
+from .models import Recipe, RecipesIngredient
+from .signals import search_index_changed
+
+SEARCH_CONFIG = 'russian'
+
+
+def search_vector():
+    """Название (вес A), ингредиенты (B) и текст рецепта (C)."""
+    ingredient_names = Subquery(
+        RecipesIngredient.objects.filter(
+            recipe=OuterRef('pk')
+        ).order_by().values('recipe').annotate(
+            names=StringAgg('ingredient__name', ' ')
+        ).values('names'),
+        output_field=TextField(),
+    )
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(ingredient_names, weight='B', config=SEARCH_CONFIG)
+        + SearchVector('text', weight='C', config=SEARCH_CONFIG)
+    )
+
+
+def update_search_index(recipe_ids=None):
+    """Пересчитывает поисковый индекс рецептов, всех при recipe_ids=None.
+
+    На PostgreSQL обновляет search_vector одним UPDATE, остальным
+    индексам сообщает сигналом search_index_changed.
+    """
+    if connection.vendor == 'postgresql':
+        recipes = Recipe.objects.all()
+        if recipe_ids is not None:
+            recipes = recipes.filter(pk__in=recipe_ids)
+        recipes.update(search_vector=search_vector())
+    search_index_changed.send(sender=Recipe, recipe_ids=recipe_ids)
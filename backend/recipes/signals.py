@@ -0,0 +1,99 @@
+from collections import Counter
+
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import Signal, receiver
+
+from .counters import COUNTER_BY_RELATION, change_counters
+from .images import schedule_variants
+from .models import CartIngredient, Favourite, Follow, Purchase, Recipe
+from users.models import User
+
+# Массовое изменение справочника (тэги, ингредиенты, оценки trending)
+# без сигналов save/delete, например bulk_create при импорте.
+reference_data_changed = Signal()
+
+# Пары (user_id, id объекта) избранного, покупок или подписок, записанные
+# в обход ORM одним запросом. created=False - пары удалены.
+relations_changed = Signal()
+
+# Изменились тексты рецептов или их ингредиенты (recipe_ids=None - все).
+search_index_changed = Signal()
+
+# Рецепты recipe_ids изменены через update() без сигнала post_save.
+recipes_updated = Signal()
+
+
+@receiver(post_save, sender=Purchase)
+def add_purchase_to_cart(sender, instance, created, **kwargs):
+    if created:
+        CartIngredient.objects.apply_purchases(
+            [(instance.user_id, instance.recipe_id)]
+        )
+
+
+@receiver(relations_changed, sender=Purchase)
+def update_cart_for_purchases(sender, pairs, created, **kwargs):
+    CartIngredient.objects.apply_purchases(pairs, sign=1 if created else -1)
+
+
+def update_counter(sender, owner_ids, sign):
+    model, field, related_field = COUNTER_BY_RELATION[sender]
+    deltas = Counter()
+    for owner_id in owner_ids:
+        deltas[owner_id] += sign
+    change_counters(model, field, deltas)
+
+
+@receiver(post_save, sender=Favourite)
+@receiver(post_save, sender=Purchase)
+@receiver(post_save, sender=Follow)
+@receiver(post_save, sender=Recipe)
+def increment_counter(sender, instance, created, **kwargs):
+    if created:
+        _, _, related_field = COUNTER_BY_RELATION[sender]
+        update_counter(sender, [getattr(instance, f'{related_field}_id')], 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def decrement_counter(sender, instance, **kwargs):
+    _, _, related_field = COUNTER_BY_RELATION[sender]
+    update_counter(sender, [getattr(instance, f'{related_field}_id')], -1)
+
+
+@receiver(relations_changed, sender=Favourite)
+@receiver(relations_changed, sender=Purchase)
+@receiver(relations_changed, sender=Follow)
+def update_counters_for_pairs(sender, pairs, created, **kwargs):
+    update_counter(sender, [owner_id for _, owner_id in pairs],
+                   1 if created else -1)
+
+
+def send_relations_removed(model, **lookup):
+    fields = [f'{name}_id' for name in model.relation_fields]
+    pairs = list(model.objects.filter(**lookup).values_list(*fields))
+    if pairs:
+        relations_changed.send(sender=model, pairs=pairs, created=False)
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_recipe_relations(sender, instance, **kwargs):
+    """Каскад удалит избранное и покупки рецепта без сигналов на строку."""
+    send_relations_removed(Favourite, recipe=instance)
+    send_relations_removed(Purchase, recipe=instance)
+
+
+@receiver(pre_delete, sender=User)
+def remove_user_relations(sender, instance, **kwargs):
+    """Каскад удалит связи пользователя без сигналов на строку."""
+    send_relations_removed(Favourite, user=instance)
+    send_relations_removed(Purchase, user=instance)
+    send_relations_removed(Follow, user=instance)
+    send_relations_removed(Follow, following=instance)
+
+
+@receiver(post_save, sender=Recipe)
+def build_image_variants(sender, instance, **kwargs):
+    if instance.image and (instance.image_variants or {}).get(
+        'source'
+    ) != instance.image.name:
+        schedule_variants(instance)
@@ -0,0 +1,59 @@
+import hashlib
+import os
+import posixpath
+import re
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+# Имя, которое даёт ContentAddressedStorage: <2 символа>/<sha256>.<ext>.
+HASHED_NAME = re.compile(r'(^|/)([0-9a-f]{2})/\2[0-9a-f]{62}\.\w+$')
+
+
+def is_content_addressed(name):
+    """Файл назван по хэшу содержимого и по этому имени не меняется."""
+    return bool(HASHED_NAME.search(name))
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранит файлы под именем из SHA-256 содержимого.
+
+    Файл кладётся в <каталог>/<первые 2 символа>/<хэш>.<расширение>;
+    повторная загрузка того же содержимого ничего не пишет на диск,
+    а только обновляет время изменения, чтобы файл не удалила сборка
+    мусора (delete_orphaned_images).
+    """
+
+    def hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        directory, filename = posixpath.split(name)
+        extension = posixpath.splitext(filename)[1].lower()
+        hexdigest = digest.hexdigest()
+        return posixpath.join(directory, hexdigest[:2],
+                              f'{hexdigest}{extension}')
+
+    def get_available_name(self, name, max_length=None):
+        # Имя с хэшем не получает суффикс: занятое имя значит, что такое
+        # содержимое уже сохранено (в том числе параллельным запросом).
+        if self.exists(name):
+            raise FileExistsError(name)
+        return name
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(name, content)
+        try:
+            return super().save(name, content, max_length)
+        except FileExistsError:
+            if not self.exists(name):
+                raise
+        os.utime(self.path(name))
+        return name
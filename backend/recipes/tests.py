@@ -0,0 +1,254 @@
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
+
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .management.commands.delete_orphaned_images import Command
+from .models import (CartIngredient, Favourite, Follow, Ingredient, Purchase,
+                     Recipe, RecipesIngredient)
+from users.models import User
+
+
+def create_user(username):
+    return User.objects.create_user(
+        username=username, email=f'{username}@example.com',
+        password='pass12345', first_name=username, last_name=username,
+    )
+
+
+def create_recipe(author, name='Рецепт'):
+    return Recipe.objects.create(author=author, name=name, text='Текст',
+                                 cooking_time=5)
+
+
+class CountersTest(TestCase):
+    """Счётчики рецептов и пользователей."""
+
+    def setUp(self):
+        self.author = create_user('author')
+        self.reader = create_user('reader')
+        self.recipe = create_recipe(self.author)
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def test_relations_change_counters(self):
+        url = f'/api/recipes/{self.recipe.id}/favorite/'
+        self.client.post(url)
+        Follow.objects.create(user=self.reader, following=self.author)
+        self.recipe.refresh_from_db()
+        self.author.refresh_from_db()
+        self.assertEqual(self.recipe.favourites_count, 1)
+        self.assertEqual(self.author.recipes_count, 1)
+        self.assertEqual(self.author.followers_count, 1)
+        self.client.delete(url)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favourites_count, 0)
+
+    def test_save_keeps_counters(self):
+        """Сохранение загруженного раньше объекта не затирает счётчики."""
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        author = User.objects.get(pk=self.author.pk)
+        Favourite.objects.create(user=self.reader, recipe=self.recipe)
+        Recipe.objects.filter(pk=recipe.pk).update(
+            image_variants={'source': 'x'}
+        )
+        create_recipe(self.author, 'Второй')
+        recipe.name = 'Новое название'
+        recipe.save()
+        author.first_name = 'Новое имя'
+        author.save()
+        recipe.refresh_from_db()
+        author.refresh_from_db()
+        self.assertEqual(recipe.name, 'Новое название')
+        self.assertEqual(recipe.favourites_count, 1)
+        self.assertEqual(recipe.image_variants, {'source': 'x'})
+        self.assertEqual(author.first_name, 'Новое имя')
+        self.assertEqual(author.recipes_count, 2)
+
+    def test_reconcile_counters(self):
+        Favourite.objects.create(user=self.reader, recipe=self.recipe)
+        Recipe.objects.filter(pk=self.recipe.pk).update(favourites_count=7)
+        User.objects.filter(pk=self.author.pk).update(recipes_count=0)
+        call_command('reconcile_counters', stdout=StringIO())
+        self.recipe.refresh_from_db()
+        self.author.refresh_from_db()
+        self.assertEqual(self.recipe.favourites_count, 1)
+        self.assertEqual(self.author.recipes_count, 1)
+        output = StringIO()
+        call_command('reconcile_counters', '--verify', stdout=output)
+        self.assertIn('Счётчики совпадают', output.getvalue())
+
+
+class CascadeDeleteTest(TestCase):
+    """Удаление рецептов и пользователей вместе с их связями."""
+
+    def setUp(self):
+        self.author = create_user('author')
+        self.ingredient = Ingredient.objects.create(name='Соль',
+                                                    measurement_unit='г')
+        self.other = self.create_recipe('Другой', 5)
+        self.readers = [create_user(f'reader{index}') for index in range(10)]
+        Purchase.objects.create(user=self.readers[0], recipe=self.other)
+
+    def create_recipe(self, name, amount, readers=()):
+        recipe = create_recipe(self.author, name)
+        RecipesIngredient.objects.create(recipe=recipe,
+                                         ingredient=self.ingredient,
+                                         amount=amount)
+        for reader in readers:
+            Favourite.objects.create(user=reader, recipe=recipe)
+            Purchase.objects.create(user=reader, recipe=recipe)
+        return recipe
+
+    def cart(self):
+        return dict(CartIngredient.objects.values_list('user__username',
+                                                       'amount'))
+
+    def delete_queries(self, recipe):
+        with CaptureQueriesContext(connection) as context:
+            Recipe.objects.get(pk=recipe.pk).delete()
+        return len(context.captured_queries)
+
+    def test_recipe_delete_does_not_scale_with_relations(self):
+        small = self.create_recipe('Мало', 2, self.readers[:2])
+        large = self.create_recipe('Много', 2, self.readers)
+        self.assertEqual(self.cart()['reader0'], 9)
+        large_queries = self.delete_queries(large)
+        self.assertEqual(self.delete_queries(small), large_queries)
+        self.assertEqual(self.cart(), {'reader0': 5})
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 1)
+
+    def test_user_delete_updates_counters(self):
+        reader = self.readers[0]
+        Favourite.objects.create(user=reader, recipe=self.other)
+        Follow.objects.create(user=reader, following=self.author)
+        reader.delete()
+        self.other.refresh_from_db()
+        self.author.refresh_from_db()
+        self.assertEqual(self.other.favourites_count, 0)
+        self.assertEqual(self.other.purchases_count, 0)
+        self.assertEqual(self.author.followers_count, 0)
+
+    def test_orm_delete_of_relations(self):
+        recipe = self.create_recipe('Рецепт', 2, self.readers[:3])
+        Favourite.objects.filter(recipe=recipe).delete()
+        Purchase.objects.get(user=self.readers[1], recipe=recipe).delete()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favourites_count, 0)
+        self.assertEqual(recipe.purchases_count, 2)
+        self.assertEqual(self.cart(), {'reader0': 7, 'reader2': 2})
+
+
+class MediaTestCase(TestCase):
+    """Тест с временным MEDIA_ROOT."""
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(MEDIA_ROOT=media_root, IMAGE_WORKERS=0)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.storage = Recipe._meta.get_field('image').storage
+
+    def make_old(self, name, minutes=120):
+        old = time.time() - minutes * 60
+        os.utime(self.storage.path(name), (old, old))
+
+
+class ContentAddressedStorageTest(MediaTestCase):
+
+    def test_same_content_same_file(self):
+        first = self.storage.save('recipes/a.png', ContentFile(b'image'))
+        second = self.storage.save('recipes/b.PNG', ContentFile(b'image'))
+        other = self.storage.save('recipes/c.png', ContentFile(b'other'))
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        self.assertRegex(first, r'^recipes/([0-9a-f]{2})/\1[0-9a-f]{62}\.png$')
+        directory = os.path.dirname(self.storage.path(first))
+        self.assertEqual(len(os.listdir(directory)), 1)
+
+    def test_repeated_upload_refreshes_mtime(self):
+        name = self.storage.save('recipes/a.png', ContentFile(b'image'))
+        self.make_old(name)
+        self.storage.save('recipes/a.png', ContentFile(b'image'))
+        age = time.time() - os.path.getmtime(self.storage.path(name))
+        self.assertLess(age, 60)
+
+    def test_concurrent_upload_keeps_hashed_name(self):
+        """Файл появился между exists() и записью: имя не меняется."""
+        name = self.storage.save('recipes/a.png', ContentFile(b'image'))
+        exists = self.storage.exists
+        calls = []
+
+        def exists_once_missing(path):
+            calls.append(path)
+            return len(calls) > 1 and exists(path)
+
+        self.storage.exists = exists_once_missing
+        try:
+            again = self.storage.save('recipes/a.png', ContentFile(b'image'))
+        finally:
+            del self.storage.exists
+        self.assertEqual(again, name)
+        directory = os.path.dirname(self.storage.path(name))
+        self.assertEqual(os.listdir(directory), [os.path.basename(name)])
+
+
+class DeleteOrphanedImagesTest(MediaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.author = create_user('author')
+
+    def save(self, content):
+        return self.storage.save('recipes/image.png', ContentFile(content))
+
+    def test_deletes_only_old_orphans(self):
+        used = self.save(b'used')
+        variant = self.storage.save('recipes/thumbnail/thumbnail.webp',
+                                    ContentFile(b'variant'))
+        orphan = self.save(b'orphan')
+        fresh = self.save(b'fresh')
+        recipe = create_recipe(self.author)
+        Recipe.objects.filter(pk=recipe.pk).update(
+            image=used, image_variants={'source': used, 'thumbnail': variant}
+        )
+        for name in (used, variant, orphan):
+            self.make_old(name)
+        call_command('delete_orphaned_images', '--batch-size', '1',
+                     stdout=StringIO())
+        self.assertTrue(self.storage.exists(used))
+        self.assertTrue(self.storage.exists(variant))
+        self.assertTrue(self.storage.exists(fresh))
+        self.assertFalse(self.storage.exists(orphan))
+
+    def test_dry_run_keeps_files(self):
+        orphan = self.save(b'orphan')
+        self.make_old(orphan)
+        output = StringIO()
+        call_command('delete_orphaned_images', '--dry-run', stdout=output)
+        self.assertIn(orphan, output.getvalue())
+        self.assertTrue(self.storage.exists(orphan))
+
+    def test_collect_rechecks_age(self):
+        """Повторная загрузка после обхода каталога спасает файл."""
+        orphan = self.save(b'orphan')
+        self.make_old(orphan)
+        threshold = timezone.now() - timedelta(minutes=60)
+        self.save(b'orphan')
+        deleted = Command().collect(self.storage, [orphan], threshold,
+                                    {'dry_run': False})
+        self.assertEqual(deleted, 0)
+        self.assertTrue(self.storage.exists(orphan))
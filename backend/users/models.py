@@ -2,7 +2,28 @@ from django.contrib.auth.models import AbstractUser
 from django.db import models
 
 
-class User(AbstractUser):
+class DerivedFieldsMixin:
+    """Обычный save() сохранённого объекта не пишет derived_fields.
+
+    Эти поля (счётчики и т.п.) меняются UPDATE-ами в обход модели,
+    поэтому в загруженном объекте они могут быть устаревшими.
+    """
+
+    derived_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.derived_fields
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
+
+class User(DerivedFieldsMixin, AbstractUser):
     "Модель для работы с пользователями"
 
     username = models.CharField(
@@ -27,6 +48,12 @@ class User(AbstractUser):
         'Фамилия',
         max_length=150,
     )
+    recipes_count = models.PositiveIntegerField(
+        'Рецептов', default=0, editable=False)
+    followers_count = models.PositiveIntegerField(
+        'Подписчиков', default=0, editable=False)
+
+    derived_fields = ('recipes_count', 'followers_count')
 
     class Meta:
         verbose_name = 'Пользователь'